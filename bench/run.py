@@ -0,0 +1,129 @@
+"""Benchmark the build on synthetic corpora and compare with a baseline
+
+For each size a corpus is made with synth.py (once, it is kept under
+bench/corpus), generate.py is run on it with the pictures taken from the
+corpus archive, and bookspellchecker.py is timed on its own with
+spellbench.py. The stage times from their build-stats.json files are
+collected into bench/results/<label>.json and compared stage by stage
+with the baseline, if there is one. Stages that got slower than the
+tolerance allows are flagged and the run exits with status 1.
+
+Save a baseline on the machine you compare on; times from another machine
+mean nothing here:
+python3 bench/run.py sizes=1000,10000 save
+python3 bench/run.py sizes=1000,10000 label=my-change
+
+Other bare words are passed on to generate.py, e.g. precompress.
+"""
+
+import json
+import os
+import os.path as osp
+from shutil import rmtree
+import subprocess
+import sys
+
+HERE = osp.dirname(osp.abspath(__file__))
+ROOT = osp.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+import myArgs
+from synth import make_corpus
+
+
+def run(script, *argv):
+    """Run one of our scripts from the top of the repo"""
+    subprocess.run([sys.executable, script, *argv], cwd=ROOT, check=True)
+
+
+def load_stats(folder):
+    with open(osp.join(folder, "build-stats.json"), "rt", encoding="utf-8") as fp:
+        return json.load(fp)
+
+
+def bench(size, args):
+    """Return {stage: stats} for the build and spell check of one corpus"""
+    corpus = osp.join(HERE, "corpus", str(size))
+    if not osp.exists(osp.join(corpus, "books.json.gz")):
+        print(f"Making a corpus of {size} books")
+        make_corpus(corpus, size, args.seed)
+    out = osp.join(HERE, "out", str(size))
+    # a clean build every time, pictures included
+    rmtree(out, ignore_errors=True)
+    build = [
+        f"out={out}",
+        f"books={osp.join(corpus, 'books.json.gz')}",
+        f"collections={osp.join(corpus, 'collections.json.gz')}",
+        f"images={osp.join(corpus, 'archive')}",
+        # every book rather than the default 100 of each kind
+        f"Nselect={size}",
+        f"workers={args.workers}",
+    ]
+    if args.spellcheck:
+        build.append("spellcheck")
+    run("generate.py", *build, *args.extra_)
+    stages = {}
+    for stage in load_stats(out)["stages"]:
+        stages[f"generate/{stage['name']}"] = stage
+    if args.spellcheck:
+        spell_out = out + "-spell"
+        run(osp.join("bench", "spellbench.py"), f"books={osp.join(corpus, 'books.json.gz')}",
+            f"out={spell_out}", f"workers={args.workers}")
+        for stage in load_stats(spell_out)["stages"]:
+            stages[f"bookspellchecker/{stage['name']}"] = stage
+    return stages
+
+
+def compare(results, baseline, tolerance):
+    """Print the change of every stage, return the ones that got too slow"""
+    slower = []
+    for size, stages in results.items():
+        old_stages = baseline.get(size, {})
+        for name, stage in stages.items():
+            old = old_stages.get(name)
+            if not old:
+                print(f"{size:>7} {name:32} {stage['wall']:9.2f}s  (not in baseline)")
+                continue
+            ratio = stage["wall"] / old["wall"] if old["wall"] else 1
+            # ignore jitter on stages that take no time
+            flag = ratio > tolerance and stage["wall"] - old["wall"] > 0.05
+            if flag:
+                slower.append((size, name))
+            print(
+                f"{size:>7} {name:32} {stage['wall']:9.2f}s  was {old['wall']:9.2f}s  "
+                f"x{ratio:.2f}{'  SLOWER' if flag else ''}"
+            )
+    return slower
+
+
+if __name__ == "__main__":
+    args = myArgs.Parse(
+        sizes="1000,10000,100000",  # corpus sizes in books, comma separated
+        label="current",  # name for bench/results/<label>.json
+        baseline="bench/baseline.json",  # results to compare with
+        save=False,  # store these results as the baseline
+        tolerance=1.25,  # flag stages whose time grew by more than this factor
+        workers=1,  # passed on to generate.py and the spell check
+        spellcheck=True,  # include spell checking in the build and time it alone
+        seed=1,  # seed for new corpora
+    )
+    results = {}
+    for size in args.sizes.split(","):
+        results[size] = bench(int(size), args)
+
+    os.makedirs(osp.join(HERE, "results"), exist_ok=True)
+    with open(osp.join(HERE, "results", f"{args.label}.json"), "wt", encoding="utf-8") as fp:
+        json.dump(results, fp, indent=1)
+
+    baseline_path = osp.join(ROOT, args.baseline)
+    if args.save:
+        with open(baseline_path, "wt", encoding="utf-8") as fp:
+            json.dump(results, fp, indent=1)
+        print(f"Saved the baseline in {args.baseline}")
+    elif osp.exists(baseline_path):
+        with open(baseline_path, "rt", encoding="utf-8") as fp:
+            slower = compare(results, json.load(fp), args.tolerance)
+        if slower:
+            sys.exit(1)
+    else:
+        print(f"No baseline in {args.baseline}, run again with save to make one")
@@ -0,0 +1,50 @@
+"""Time bookspellchecker.py on its own
+
+Loads the dictionary, then spell checks every English book in a corpus
+with a cold verdict cache and again with the cache warm, writing the
+stages to build-stats.json in out the same way generate.py does.
+
+python3 bench/spellbench.py books=bench/corpus/1000/books.json.gz out=bench/out/1000-spell
+"""
+
+import gzip
+import json
+import os.path as osp
+import sys
+from tempfile import TemporaryDirectory
+
+sys.path.insert(0, osp.dirname(osp.dirname(osp.abspath(__file__))))
+
+import myArgs
+from buildstats import BuildStats
+import bookspellchecker
+import nltkdata
+
+args = myArgs.Parse(
+    books="bench/corpus/1000/books.json.gz",  # corpus to check
+    out="bench/out/spell",  # folder for build-stats.json
+    mode="simple",  # spell checking mode, simple or complex
+    workers=1,  # number of processes for spell checking
+)
+
+stats = BuildStats()
+stats.stage("load")
+with gzip.open(args.books, "rt", encoding="utf-8") as fp:
+    books = [book for book in json.load(fp) if book["language"] == "en"]
+stats.items(len(books))
+
+stats.stage("dictionary")
+bookspellchecker.BookSpellCheck.load_dictionary()
+
+stop_words = nltkdata.stop_words("english")
+with TemporaryDirectory() as folder:
+    cache = osp.join(folder, "verdicts.sd")
+    for stage in ("cold", "warm"):
+        stats.stage(f"{args.mode}-{stage}")
+        checker = bookspellchecker.BookSpellCheck(stop_words=stop_words, cache_path=cache)
+        kept = checker.spellcheck(books, mode=args.mode, workers=args.workers)[0]
+        stats.items(len(books))
+        print(f"{stage} cache: kept {len(kept)} of {len(books)} books")
+
+stats.save(args.out)
+stats.report()
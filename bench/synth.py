@@ -0,0 +1,153 @@
+"""Make a synthetic Tar Heel Reader corpus for benchmarks
+
+Writes books.json.gz and collections.json.gz in the shape fetchBooks.py
+and fetchCollections.py produce, plus an archive folder of pictures that
+generate.py can take with images=<folder>. Page text is drawn from an
+early reader vocabulary with a Zipf-like distribution and sprinkled with
+numbers, contractions, names and misspellings so that stemming and spell
+checking have the same kind of work as on the real books. Pictures are
+shared between books the way popular uploads are.
+
+python3 bench/synth.py books=10000 out=bench/corpus/10000
+"""
+
+import gzip
+import json
+import os
+import os.path as osp
+import random
+import sys
+
+sys.path.insert(0, osp.dirname(osp.dirname(osp.abspath(__file__))))
+
+try:
+    from PIL import Image
+except ImportError:  # pictures are just bytes then
+    Image = None
+
+VOCABULARY = """
+the a and to is I you it in said he she we they my of was on for at with his
+her can see look like go up down here there this that what where who come
+play run jump big little red blue yellow green orange purple black white
+brown pink one two three four five six seven eight nine ten dog cat fish
+bird frog bear lion tiger monkey horse cow pig duck hen sheep goat mouse
+rabbit elephant giraffe zebra snake turtle mom dad baby sister brother
+grandma grandpa friend teacher school book ball car bus truck boat train
+plane bike house tree flower sun moon star rain snow wind water apple
+banana orange cake cookie bread milk juice pizza happy sad mad scared
+tired hungry fast slow hot cold eat drink sleep read write sing dance swim
+walk ride climb help make find love want need have has do does did get got
+went came saw put take give tell ask day night morning today tomorrow
+spring summer fall winter birthday party game music color shape circle
+square triangle letter word number count add more less all some many
+""".split()
+
+NAMES = "Sam Ana Ben Maya Leo Zoe Max Lily Omar Emma Jack Mia".split()
+CONTRACTIONS = "I'm can't don't it's let's we're you're didn't".split()
+CATEGORIES = "Alph Anim ArtM Biog Fair Fict Food Heal Hist Holi Math Nurs Peop Poet Recr Spor".split()
+AUTHORS = ["DLM"] + [f"author{i}" for i in range(200)]
+
+
+def zipf_weights(n, s=1.1):
+    return [1 / (rank + 1) ** s for rank in range(n)]
+
+
+def misspell(word, rnd):
+    """swap two letters the way a hurried typist does"""
+    if len(word) < 3:
+        return word
+    i = rnd.randrange(len(word) - 1)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+def sentence(rnd, weights):
+    words = rnd.choices(VOCABULARY, weights, k=rnd.randint(3, 10))
+    roll = rnd.random()
+    if roll < 0.15:
+        words.insert(0, rnd.choice(NAMES))
+    elif roll < 0.25:
+        words.insert(rnd.randrange(len(words)), str(rnd.randint(1, 100)))
+    elif roll < 0.32:
+        words.insert(0, rnd.choice(CONTRACTIONS))
+    elif roll < 0.35:
+        i = rnd.randrange(len(words))
+        words[i] = misspell(words[i], rnd)
+    text = " ".join(words)
+    return text[0].upper() + text[1:] + rnd.choice("..!?")
+
+
+def picture(path, i, rnd):
+    """write a small picture, a real JPEG when Pillow is around"""
+    os.makedirs(osp.dirname(path), exist_ok=True)
+    if Image is None:
+        with open(path, "wb") as fp:
+            fp.write(bytes(rnd.randrange(256) for _ in range(2048)))
+        return
+    color = (i * 37 % 256, i * 91 % 256, i * 53 % 256)
+    Image.new("RGB", (320, 240), color).save(path, "JPEG", quality=95)
+
+
+def make_corpus(out, nbooks, seed=1, pictures=0):
+    """Write the corpus for nbooks books into out"""
+    rnd = random.Random(seed)
+    weights = zipf_weights(len(VOCABULARY))
+    # a picture pool a few times the book count, capped so 100k books
+    # do not need a million files
+    npictures = pictures or min(nbooks * 3, 50000)
+    popular = zipf_weights(npictures, 0.8)
+    os.makedirs(out, exist_ok=True)
+    archive = osp.join(out, "archive")
+    made = set()
+
+    books = []
+    for i in range(nbooks):
+        pages = []
+        for _ in range(rnd.randint(4, 24)):
+            n = rnd.choices(range(npictures), popular)[0]
+            url = f"/cache/images/{n % 100:02d}/{n}.jpg"
+            if n not in made:
+                picture(archive + url, n, rnd)
+                made.add(n)
+            pages.append(dict(text=" ".join(sentence(rnd, weights) for _ in range(rnd.randint(1, 2))), url=url))
+        rating_count = rnd.choice([0, 0, 1, 2, 5, 20])
+        books.append(dict(
+            ID=i + 1,
+            slug=f"synthetic-book-{i + 1}",
+            title=" ".join(rnd.choices(VOCABULARY, weights, k=rnd.randint(1, 5))).title(),
+            author=rnd.choices(AUTHORS, zipf_weights(len(AUTHORS)))[0],
+            language=rnd.choices(["en", "es", "fr", "de"], [85, 8, 4, 3])[0],
+            categories=rnd.sample(CATEGORIES, rnd.choice([0, 1, 1, 2, 3])),
+            audience=rnd.choices("ECA", [70, 20, 10])[0],
+            reviewed=rnd.random() < 0.2,
+            rating_count=rating_count,
+            rating_total=sum(rnd.randint(1, 3) for _ in range(rating_count)),
+            pages=pages,
+        ))
+    with gzip.open(osp.join(out, "books.json.gz"), "wt", encoding="utf-8") as fp:
+        json.dump(books, fp)
+
+    collections = {}
+    for j in range(max(1, nbooks // 50)):
+        slug = f"synthetic-collection-{j + 1}"
+        collections[slug] = dict(
+            title=f"Collection {j + 1}",
+            description="",
+            slug=slug,
+            book_slugs=[books[rnd.randrange(nbooks)]["slug"] for _ in range(rnd.randint(3, 30))],
+        )
+    with gzip.open(osp.join(out, "collections.json.gz"), "wt", encoding="utf-8") as fp:
+        json.dump(collections, fp)
+    return len(made)
+
+
+if __name__ == "__main__":
+    import myArgs
+
+    args = myArgs.Parse(
+        books=1000,  # number of books to make
+        out="bench/corpus/1000",  # folder for books.json.gz, collections.json.gz and archive
+        seed=1,  # the same seed makes the same corpus
+        pictures=0,  # size of the picture pool, 0 to pick one from the number of books
+    )
+    made = make_corpus(args.out, args.books, args.seed, args.pictures)
+    print(f"Made {args.books} books with {made} pictures in {args.out}")
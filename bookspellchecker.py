@@ -1,27 +1,51 @@
+from collections import OrderedDict
+from hashlib import sha1
 from string import punctuation as string_punctuation
-from re import escape as regex_escape, match as regex_match, split as regex_split
-from nltk import word_tokenize, pos_tag, download as nltk_download
+from re import compile as regex_compile, escape as regex_escape, match as regex_match, split as regex_split
+from nltk import word_tokenize, pos_tag, pos_tag_sents
 from pkg_resources import resource_filename
 from symspellpy import SymSpell, Verbosity
 from spellchecker import SpellChecker
-from pint import UnitRegistry
-from pint.errors import UndefinedUnitError, DefinitionSyntaxError, DimensionalityError
+import spellchecker
+from sqlitedict import SqliteDict
+from pools import make_pool
+import nltkdata
 
 class IsNumberHelper:
 
-    ureg = UnitRegistry()
+    # made on first use, building the unit registry takes most of a second
+    ureg = None
 
-    @staticmethod 
+    # isOrderedNumber, isMathExpression and isScientificNotation are prefix
+    # matches, so between them they accept exactly the strings that start
+    # like this; the ^ in isExponent is an anchor so it never matches
+    leadingNumber = regex_compile(r'[123456789]|-10\^[-+]?\d')
+
+    # verdicts for the strings seen so far, the same words come up over and
+    # over and the pint fallback is very slow
+    verdicts = {}
+    maxVerdicts = 200000
+
+    @staticmethod
     def isNumber(string):
-        return string.isdigit() \
-            or IsNumberHelper.isCommaNumber(string) \
-            or IsNumberHelper.isOrderedNumber(string) \
-            or IsNumberHelper.isMathExpression(string) \
-            or IsNumberHelper.isScientificNotation(string) \
-            or IsNumberHelper.isExponent(string) \
-            or IsNumberHelper.isHyphenNumber(string) \
-            or IsNumberHelper.isSlashNumber(string) \
-            or IsNumberHelper.isNumberWithUnits(string)
+        verdicts = IsNumberHelper.verdicts
+        if string in verdicts:
+            return verdicts[string]
+        verdict = IsNumberHelper.classify(string)
+        if len(verdicts) < IsNumberHelper.maxVerdicts:
+            verdicts[string] = verdict
+        return verdict
+
+    @staticmethod
+    def classify(string):
+        # the cheap checks on the first characters settle anything that
+        # starts like a number, only the rest can need pint
+        return bool(string.isdigit()
+                    or IsNumberHelper.leadingNumber.match(string)
+                    or IsNumberHelper.isCommaNumber(string)
+                    or IsNumberHelper.isHyphenNumber(string)
+                    or IsNumberHelper.isSlashNumber(string)
+                    or IsNumberHelper.isNumberWithUnits(string))
 
 
     @staticmethod
@@ -54,6 +78,10 @@ class IsNumberHelper:
     
     @staticmethod
     def isNumberWithUnits(string):
+        from pint import UnitRegistry
+        from pint.errors import UndefinedUnitError, DefinitionSyntaxError, DimensionalityError
+        if IsNumberHelper.ureg is None:
+            IsNumberHelper.ureg = UnitRegistry()
         try:
             return IsNumberHelper.ureg.parse_expression(string)
         except (UndefinedUnitError, AttributeError, DefinitionSyntaxError, DimensionalityError):
@@ -63,10 +91,17 @@ class SpellCheckHelper:
     punctuation = string_punctuation + 'º–°…-'
     regex_punctuation = str(regex_escape(punctuation))
 
-    spell = SpellChecker()
+    # made on first use like IsNumberHelper.ureg
+    spell = None
 
     digits = '0123456789'
 
+    @staticmethod
+    def speller():
+        if SpellCheckHelper.spell is None:
+            SpellCheckHelper.spell = SpellChecker()
+        return SpellCheckHelper.spell
+
     @staticmethod
     def isTime(string):
         return regex_match(r'(\d)?\d:\d\d(pm|am|PM|AM)?', string) or regex_match(r'\d\d?(pm|am|PM|AM)', string)
@@ -107,20 +142,139 @@ class SpellCheckHelper:
             or SpellCheckHelper.isNum(text) \
             or SpellCheckHelper.isTime(text) \
             or len(sym_spell.lookup(text, Verbosity.CLOSEST, max_edit_distance=0)) > 0 \
-            or len(SpellCheckHelper.spell.known(words=[text])) > 0
+            or len(SpellCheckHelper.speller().known(words=[text])) > 0
+
+
+class VerdictCache:
+    """Remember whether each word passed the spell check
+
+    Verdicts are keyed by (word, mode) and kept in a bounded LRU in memory
+    and, when given a path, in a sqlite file shared across runs. The file is
+    emptied whenever the dictionary version changes.
+    """
+
+    # bump when the checking logic changes
+    logic_version = 1
+
+    def __init__(self, path=None, dictionary_path=None, size=100000, commit_every=1000, readonly=False):
+        self.memory = OrderedDict()
+        self.size = size
+        self.commit_every = commit_every
+        self.pending = 0
+        # verdicts made since the last take_fresh
+        self.fresh = {}
+        self.store = None
+        if path and readonly:
+            self.store = SqliteDict(path, tablename='verdicts', flag='r')
+        elif path:
+            self.store = SqliteDict(path, tablename='verdicts')
+            version = VerdictCache.version(dictionary_path)
+            meta = SqliteDict(path, tablename='meta', autocommit=True)
+            if meta.get('version') != version:
+                self.store.clear()
+                self.store.commit()
+                meta['version'] = version
+            meta.close()
+
+    @staticmethod
+    def version(dictionary_path):
+        digest = sha1(str(VerdictCache.logic_version).encode())
+        digest.update(getattr(spellchecker, '__version__', '').encode())
+        if dictionary_path:
+            with open(dictionary_path, 'rb') as fp:
+                digest.update(fp.read())
+        return digest.hexdigest()
+
+    def remember(self, key, verdict):
+        self.memory[key] = verdict
+        if len(self.memory) > self.size:
+            self.memory.popitem(last=False)
+
+    def get(self, word, mode):
+        key = mode + '\t' + word
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            return self.memory[key]
+        if self.store is not None:
+            verdict = self.store.get(key)
+            if verdict is not None:
+                self.remember(key, verdict)
+            return verdict
+        return None
+
+    def put(self, word, mode, verdict):
+        key = mode + '\t' + word
+        self.remember(key, verdict)
+        self.fresh[key] = verdict
+        if self.store is not None and self.store.flag != 'r':
+            self.store[key] = verdict
+            self.pending += 1
+            if self.pending >= self.commit_every:
+                self.store.commit()
+                self.pending = 0
+
+    def take_fresh(self):
+        fresh, self.fresh = self.fresh, {}
+        return fresh
+
+    def put_fresh(self, fresh):
+        for key, verdict in fresh.items():
+            mode, word = key.split('\t', 1)
+            self.put(word, mode, verdict)
+
+    def close(self):
+        if self.store is not None:
+            if self.store.flag != 'r':
+                self.store.commit()
+            self.store.close()
+            self.store = None
+
+
+# the checker in a worker process, set by _init_worker
+_worker = None
+# the dictionary loaded by the parent, inherited by forked workers
+_sym_spell = None
+
+
+def _init_worker(spellcheckdata, stop_words, cache_path, dictionary_path, mode):
+    global _worker
+    sym_spell = _sym_spell
+    if sym_spell is None:
+        sym_spell, dictionary_path = BookSpellCheck.load_dictionary()
+    checker = BookSpellCheck(spellcheckdata=spellcheckdata, stop_words=stop_words)
+    checker.verdicts = VerdictCache(cache_path, dictionary_path, readonly=True)
+    _worker = (checker, sym_spell, mode)
+
+
+def _check_book(texts):
+    """Check one book in a worker, return its verdict and what was learned"""
+    checker, sym_spell, mode = _worker
+    if checker.spellcheckdata:
+        checker.set_unknown = set()
+        checker.set_known = set()
+    correct = checker.hasNoSpellingErrorsInTexts(texts, sym_spell, mode)
+    return correct, checker.set_unknown, checker.set_known, checker.verdicts.take_fresh()
 
 
 class BookSpellCheck:
 
-    def __init__(self, spellcheckdata=False, stop_words=None):
+    def __init__(self, spellcheckdata=False, stop_words=None, cache_path=None):
         self.spellcheckdata = spellcheckdata
         self.set_unknown = set() if self.spellcheckdata else None
         self.set_known = set() if self.spellcheckdata else None
         self.stop_words = stop_words
+        self.cache_path = cache_path
+        self.verdicts = VerdictCache()
 
     def get_words_to_spell(self, text):
-        text = word_tokenize(text)
-        tags = pos_tag(text)
+        return self.get_words_from_tags(pos_tag(word_tokenize(text)))
+
+    def get_words_to_spell_in_pages(self, texts):
+        # tag all the pages in one call to save the tagger overhead per page
+        tagged = pos_tag_sents([word_tokenize(text) for text in texts])
+        return [self.get_words_from_tags(tags) for tags in tagged]
+
+    def get_words_from_tags(self, tags):
         # filter out proper nouns - we assume these are spelled correctly
         if self.spellcheckdata:
             self.set_known.update([word for word, tag in tags if tag in ['NNP', 'NNPS'] or word.lower() in self.stop_words])
@@ -161,19 +315,24 @@ class BookSpellCheck:
             raise ValueError('Invalid mode')
 
     def hasNoSpellingErrors(self, book, sym_spell, mode='simple'):
+        return self.hasNoSpellingErrorsInTexts([page['text'] for page in book['pages']], sym_spell, mode)
+
+    def hasNoSpellingErrorsInTexts(self, texts, sym_spell, mode='simple'):
         if self.spellcheckdata:
             correct = True
-        for page in book['pages']:
-            words = self.get_words_to_spell(page['text'])
+        for words in self.get_words_to_spell_in_pages(texts):
 
             if len(words) == 0:
                 continue
 
             for word in words:
-                search_space = self.generate_search_space(word, mode)
+                curr_correct = self.verdicts.get(word, mode)
+                if curr_correct is None:
+                    search_space = self.generate_search_space(word, mode)
 
-                # print (search_space)
-                curr_correct = any([SpellCheckHelper.correct(search, sym_spell) for search in search_space])
+                    # print (search_space)
+                    curr_correct = any([SpellCheckHelper.correct(search, sym_spell) for search in search_space])
+                    self.verdicts.put(word, mode, curr_correct)
 
                 # print (f'{search_space} {curr_correct}')
 
@@ -191,16 +350,54 @@ class BookSpellCheck:
             return correct
         return True
 
-    def spellcheck(self, books, mode='simple'):
-        if mode not in ['simple', 'complex']:
-            raise ValueError('Mode must be one of "simple, complex"')
-        nltk_download('punkt')
+    @staticmethod
+    def load_dictionary():
         sym_spell = SymSpell(max_dictionary_edit_distance=0, prefix_length=7)
         dictionary_path = resource_filename(
             "symspellpy", "frequency_dictionary_en_82_765.txt")
         if not sym_spell.load_dictionary(dictionary_path, term_index=0, count_index=1):
+            return None, dictionary_path
+        return sym_spell, dictionary_path
+
+    def spellcheck(self, books, mode='simple', workers=1):
+        if mode not in ['simple', 'complex']:
+            raise ValueError('Mode must be one of "simple, complex"')
+        nltkdata.ensure('punkt', 'averaged_perceptron_tagger')
+        sym_spell, dictionary_path = BookSpellCheck.load_dictionary()
+        if sym_spell is None:
             return books
 
-        books = [book for book in books if self.hasNoSpellingErrors(
-            book, sym_spell, mode)]
+        self.verdicts = VerdictCache(self.cache_path, dictionary_path)
+        if workers <= 1:
+            books = [book for book in books if self.hasNoSpellingErrors(
+                book, sym_spell, mode)]
+        else:
+            books = self.spellcheck_in_pool(books, mode, workers, sym_spell, dictionary_path)
+        self.verdicts.close()
         return books, self.set_unknown, self.set_known
+
+    def spellcheck_in_pool(self, books, mode, workers, sym_spell, dictionary_path):
+        # forked workers share our dictionary, others load it once; workers
+        # only read the verdict store and what they learn is merged here in
+        # book order
+        global _sym_spell
+        _sym_spell = sym_spell
+        # close our connection to the store before forking
+        self.verdicts.close()
+        initargs = (self.spellcheckdata, self.stop_words, self.cache_path, dictionary_path, mode)
+        texts = ([page['text'] for page in book['pages']] for book in books)
+        kept = []
+        fresh = {}
+        with make_pool(workers, _init_worker, initargs) as pool:
+            results = pool.imap(_check_book, texts, chunksize=8)
+            for book, (correct, unknown, known, verdicts) in zip(books, results):
+                if correct:
+                    kept.append(book)
+                if self.spellcheckdata:
+                    self.set_unknown.update(unknown)
+                    self.set_known.update(known)
+                fresh.update(verdicts)
+        _sym_spell = None
+        self.verdicts = VerdictCache(self.cache_path, dictionary_path)
+        self.verdicts.put_fresh(fresh)
+        return kept
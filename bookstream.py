@@ -0,0 +1,103 @@
+"""Read books out of books.json.gz one at a time
+
+The array is decoded one element at a time from a window of the
+decompressed text. Each book is tested as it arrives, and only the fields
+the build uses are kept from the ones that qualify.
+"""
+
+from gzip import open as gzip_open
+from json import JSONDecoder
+
+# what generate.py and the spell checker look at
+BOOK_FIELDS = (
+    "ID", "slug", "title", "author", "language", "categories", "audience",
+    "reviewed", "rating_total", "rating_count", "pages",
+)
+PAGE_FIELDS = ("text", "url")
+
+WHITESPACE = " \t\n\r"
+
+
+def iter_array(fp, chunk=1 << 20):
+    """Yield the elements of the JSON array in the text file fp"""
+    decode = JSONDecoder().raw_decode
+    buf = ""
+    pos = 0
+    eof = False
+    started = False
+
+    while True:
+        # skip to the next element, reading more when we run out
+        while True:
+            while pos < len(buf) and buf[pos] in WHITESPACE:
+                pos += 1
+            if pos < len(buf) or eof:
+                break
+            buf, pos = fp.read(chunk), 0
+            eof = not buf
+        if pos >= len(buf):
+            raise ValueError("books file ended inside the array")
+        char = buf[pos]
+        if not started:
+            if char != "[":
+                raise ValueError("books file is not a JSON array")
+            started = True
+            pos += 1
+            continue
+        if char == "]":
+            return
+        if char == ",":
+            pos += 1
+            continue
+        try:
+            value, end = decode(buf, pos)
+        except ValueError:
+            if eof:
+                raise
+            # the element runs past the window, drop what we used and read on
+            more = fp.read(chunk)
+            eof = not more
+            buf, pos = buf[pos:] + more, 0
+            continue
+        # a number cut off by the end of the window still decodes, so only
+        # trust a value that is followed by a comma or the closing bracket
+        after = end
+        while after < len(buf) and buf[after] in WHITESPACE:
+            after += 1
+        if after == len(buf) or buf[after] not in ",]":
+            if eof:
+                raise ValueError("books file has junk after an element")
+            more = fp.read(chunk)
+            eof = not more
+            buf, pos = buf[pos:] + more, 0
+            continue
+        yield value
+        pos = end
+        if pos > chunk:
+            buf, pos = buf[pos:], 0
+
+
+def project(book):
+    """Keep only the fields the build uses"""
+    slim = {key: book[key] for key in BOOK_FIELDS if key in book}
+    slim["pages"] = [{key: page[key] for key in PAGE_FIELDS if key in page}
+                     for page in book["pages"]]
+    return slim
+
+
+def load_books(path, qualifies=None, done=None):
+    """Return (books in path that qualify, number of books read)
+
+    done is called with each book kept and reading stops when it says so.
+    """
+    books = []
+    read = 0
+    with gzip_open(path, "rt", encoding="utf-8") as fp:
+        for book in iter_array(fp):
+            read += 1
+            if qualifies is not None and not qualifies(book):
+                continue
+            books.append(project(book))
+            if done is not None and done(books[-1]):
+                break
+    return books, read
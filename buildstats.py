@@ -0,0 +1,127 @@
+"""Time the stages of a build
+
+generate.py is one long script, so a stage runs from one call of stage()
+to the next rather than inside a with block. For each stage we record wall
+time, CPU time of this process and of the worker processes it waited on,
+peak resident memory and an item count, and write them all to
+build-stats.json in the output folder. With profile set, each stage is
+also profiled into a .prof file next to it, for snakeviz or pstats.
+"""
+
+import cProfile
+from json import dump as json_dump
+from os import makedirs, replace
+import os.path as osp
+from time import perf_counter, process_time
+
+try:
+    from resource import getrusage, RUSAGE_SELF, RUSAGE_CHILDREN
+except ImportError:  # not on a unix
+    getrusage = None
+
+
+def children_cpu():
+    """CPU seconds used by the worker processes that have finished"""
+    if getrusage is None:
+        return 0.0
+    usage = getrusage(RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def reset_peak():
+    """Start a new peak RSS measurement, False where that is not possible"""
+    try:
+        with open("/proc/self/clear_refs", "wt") as fp:
+            fp.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss():
+    """Peak resident memory in kB since the last reset_peak or the start"""
+    try:
+        with open("/proc/self/status", "rt") as fp:
+            for line in fp:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    if getrusage is None:
+        return 0
+    # kB on linux, bytes on macOS
+    return getrusage(RUSAGE_SELF).ru_maxrss
+
+
+class BuildStats:
+    """Measure consecutive stages and write them out at the end"""
+
+    def __init__(self, profile=False):
+        self.profile = profile
+        self.stages = []
+        self.current = None
+        self.start = perf_counter()
+
+    def stage(self, name):
+        """End the stage that is running, if any, and start the next one"""
+        self.end()
+        self.current = dict(
+            name=name,
+            items=None,
+            wall=perf_counter(),
+            cpu=process_time(),
+            children_cpu=children_cpu(),
+            peak_reset=reset_peak(),
+            profiler=cProfile.Profile() if self.profile else None,
+        )
+        if self.current["profiler"]:
+            self.current["profiler"].enable()
+
+    def items(self, count):
+        """Record how many things the current stage worked on"""
+        self.current["items"] = count
+
+    def end(self):
+        """End the stage that is running"""
+        current, self.current = self.current, None
+        if current is None:
+            return
+        profiler = current.pop("profiler")
+        if profiler:
+            profiler.disable()
+        current["wall"] = round(perf_counter() - current["wall"], 4)
+        current["cpu"] = round(process_time() - current["cpu"], 4)
+        current["children_cpu"] = round(children_cpu() - current["children_cpu"], 4)
+        current["peak_rss_kb"] = peak_rss()
+        self.stages.append((current, profiler))
+
+    def save(self, folder, name="build-stats.json"):
+        """Write the stats, and the profiles if any, into folder"""
+        self.end()
+        makedirs(folder, exist_ok=True)
+        stages = []
+        for i, (stage, profiler) in enumerate(self.stages):
+            if profiler:
+                stage["profile"] = f"build-stats-{i:02d}-{stage['name']}.prof"
+                profiler.dump_stats(osp.join(folder, stage["profile"]))
+            stages.append(stage)
+        stats = dict(
+            wall=round(perf_counter() - self.start, 4),
+            peak_rss_kb=max((stage["peak_rss_kb"] for stage in stages), default=0),
+            stages=stages,
+        )
+        path = osp.join(folder, name)
+        with open(path + ".tmp", "wt", encoding="utf-8") as fp:
+            json_dump(stats, fp, indent=1)
+        replace(path + ".tmp", path)
+        return stats
+
+    def report(self):
+        """Print one line per stage"""
+        for stage, _ in self.stages:
+            items = "" if stage["items"] is None else f", {stage['items']} items"
+            print(
+                f"Stage {stage['name']}: {stage['wall']:.2f}s wall, "
+                f"{stage['cpu'] + stage['children_cpu']:.2f}s cpu, "
+                f"peak {stage['peak_rss_kb'] // 1024} MB{items}"
+            )
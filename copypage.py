@@ -1,12 +1,11 @@
 """Assemble a web page"""
 
-from mako.template import Template
-from mako import exceptions
 import os
 import os.path as osp
 import shutil
 from html5print import HTMLBeautifier
 import myArgs
+from templates import registry
 
 
 class CopyPage:
@@ -19,16 +18,10 @@ class CopyPage:
 
     def include(self, name, **kwargs):
         """Render a template with traceback"""
-        with open(osp.join(self.src, name), "rt") as fp:
-            template = fp.read()
-        try:
-            html = Template(template).render(
-                **kwargs, include=self.include, copy=self.copy, link=self.link
-            )
-        except Exception:
-            print(exceptions.text_error_template().render())
-            raise
-        return html
+        return registry.render(
+            osp.join(self.src, name),
+            **kwargs, include=self.include, copy=self.copy, link=self.link
+        )
 
     def copy(self, fname):
         """Copy a file and return its name"""
@@ -59,7 +52,10 @@ class CopyPage:
 
 
 if __name__ == "__main__":
-    args = myArgs.Parse()
+    args = myArgs.Parse(
+        templateCache="",  # folder to keep compiled templates in between runs
+    )
+    registry.module_directory = args.templateCache
 
     cp = CopyPage()
 
@@ -0,0 +1,211 @@
+"""Keep books.json.gz preprocessed for repeated builds
+
+The first build with a corpus cache folder ingests the archive into a
+folder named after the sha1 of books.json.gz:
+
+    columns.json    the small per book fields, one list per field
+    books.idx       first page of each book (int64, one more than books)
+    text.idx        start of each page text in text.bin (int64)
+    text.bin        page texts in utf-8, the pages of a book back to back
+    url.idx/url.bin the same for the picture urls
+    words-<key>.*   the stems of each book, space separated, for one
+                    stemmer and stop word list
+
+The .bin and .idx files are memory mapped, so a build only pages in the
+text of the books it looks at. Changing books.json.gz changes the hash
+and leads to a fresh ingest; old folders can simply be deleted. A folder
+written with another VERSION of this layout is ingested again too.
+"""
+
+from array import array
+from hashlib import sha1
+from json import load as json_load, dump as json_dump
+from mmap import mmap, ACCESS_READ
+from os import makedirs, replace
+import os.path as osp
+from shutil import rmtree
+from gzip import open as gzip_open
+from bookstream import iter_array, BOOK_FIELDS
+
+VERSION = 1
+COLUMNS = [field for field in BOOK_FIELDS if field != "pages"]
+
+
+def file_hash(path):
+    """sha1 of a file read in blocks"""
+    h = sha1()
+    with open(path, "rb") as fp:
+        for block in iter(lambda: fp.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def map_bytes(path):
+    """Memory map a file for reading, empty files give empty bytes"""
+    if osp.getsize(path) == 0:
+        return b""
+    with open(path, "rb") as fp:
+        return mmap(fp.fileno(), 0, access=ACCESS_READ)
+
+
+def map_offsets(path):
+    """Memory map an array of int64 offsets"""
+    return memoryview(map_bytes(path)).cast("q")
+
+
+class StringWriter:
+    """Write strings back to back in name.bin with their offsets in name.idx"""
+
+    def __init__(self, folder, name):
+        self.path = osp.join(folder, name)
+        self.fp = open(self.path + ".bin", "wb")
+        self.offsets = array("q", [0])
+
+    def add(self, string):
+        data = string.encode("utf-8")
+        self.fp.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+
+    def close(self):
+        self.fp.close()
+        with open(self.path + ".idx", "wb") as fp:
+            self.offsets.tofile(fp)
+
+
+class Pages:
+    """The pages of one cached book, read from the maps when asked for"""
+
+    def __init__(self, corpus, first, last):
+        self.corpus = corpus
+        self.first = first
+        self.last = last
+
+    def __len__(self):
+        return self.last - self.first
+
+    def __iter__(self):
+        for page in range(self.first, self.last):
+            yield self.corpus.page(page)
+
+    def search(self, query):
+        """True if query occurs in one of the pages"""
+        corpus = self.corpus
+        start = corpus.text_idx[self.first]
+        end = corpus.text_idx[self.last]
+        if corpus.text[start:end].find(query.encode("utf-8")) < 0:
+            return False
+        # found in the run of pages, make sure it is not across two of them
+        return any(query in page["text"] for page in self)
+
+
+class CorpusCache:
+    """Memory mapped, column oriented copy of a books.json.gz"""
+
+    def __init__(self, root, source):
+        self.source = source
+        self.folder = osp.join(root, file_hash(source))
+        stored = self.read_columns()
+        if stored is None or stored.get("version") != VERSION:
+            self.ingest(self.folder)
+            stored = self.read_columns()
+        self.columns = stored["columns"]
+        self.count = len(self.columns["slug"])
+        self.books_idx = map_offsets(osp.join(self.folder, "books.idx"))
+        self.text_idx = map_offsets(osp.join(self.folder, "text.idx"))
+        self.text = map_bytes(osp.join(self.folder, "text.bin"))
+        self.url_idx = map_offsets(osp.join(self.folder, "url.idx"))
+        self.url = map_bytes(osp.join(self.folder, "url.bin"))
+        self.numbers = {slug: i for i, slug in enumerate(self.columns["slug"])}
+        self.stems = None
+
+    def read_columns(self):
+        """The contents of columns.json or None if the folder is not complete"""
+        path = osp.join(self.folder, "columns.json")
+        if not osp.exists(path):
+            return None
+        with open(path, "rt", encoding="utf-8") as fp:
+            return json_load(fp)
+
+    def ingest(self, folder):
+        """Write the cache for the source into folder"""
+        print(f"Ingesting {self.source} into {folder}")
+        tmp = folder + ".tmp"
+        rmtree(tmp, ignore_errors=True)
+        makedirs(tmp)
+        columns = {field: [] for field in COLUMNS}
+        first_pages = array("q", [0])
+        texts = StringWriter(tmp, "text")
+        urls = StringWriter(tmp, "url")
+        with gzip_open(self.source, "rt", encoding="utf-8") as fp:
+            for book in iter_array(fp):
+                for field in COLUMNS:
+                    columns[field].append(book.get(field))
+                for page in book["pages"]:
+                    texts.add(page["text"])
+                    urls.add(page["url"])
+                first_pages.append(len(texts.offsets) - 1)
+        texts.close()
+        urls.close()
+        with open(osp.join(tmp, "books.idx"), "wb") as fp:
+            first_pages.tofile(fp)
+        # written last, it marks the folder as complete
+        with open(osp.join(tmp, "columns.json"), "wt", encoding="utf-8") as fp:
+            json_dump(dict(version=VERSION, columns=columns), fp)
+        # a folder left by another version goes, stems and all
+        rmtree(folder, ignore_errors=True)
+        replace(tmp, folder)
+
+    def page(self, number):
+        """One page as the dict the build expects"""
+        return dict(
+            text=self.text[self.text_idx[number]:self.text_idx[number + 1]].decode("utf-8"),
+            url=self.url[self.url_idx[number]:self.url_idx[number + 1]].decode("utf-8"),
+        )
+
+    def record(self, i):
+        """Book i with its pages left in the maps"""
+        book = {field: self.columns[field][i] for field in COLUMNS}
+        book["pages"] = Pages(self, self.books_idx[i], self.books_idx[i + 1])
+        return book
+
+    def book(self, i):
+        """Book i with its pages read out"""
+        book = self.record(i)
+        book["pages"] = list(book["pages"])
+        return book
+
+    def load_books(self, qualifies=None, done=None):
+        """Like bookstream.load_books but from the cache"""
+        books = []
+        for i in range(self.count):
+            if qualifies is not None and not qualifies(self.record(i)):
+                continue
+            books.append(self.book(i))
+            if done is not None and done(books[-1]):
+                return books, i + 1
+        return books, self.count
+
+    def words(self, slug, normalizer):
+        """The stems of a book, worked out for every book the first time"""
+        if self.stems is None:
+            self.stems = self.load_stems(normalizer)
+        i = self.numbers[slug]
+        idx, data = self.stems
+        text = data[idx[i]:idx[i + 1]].decode("utf-8")
+        return set(text.split()) if text else set()
+
+    def load_stems(self, normalizer):
+        """Map the stems made with this normalizer, making them if needed"""
+        name = f"words-{normalizer.key[:16]}"
+        path = osp.join(self.folder, name)
+        if not osp.exists(path + ".idx"):
+            print(f"Stemming {self.count} books for the corpus cache")
+            stems = StringWriter(self.folder, name + ".tmp")
+            for i in range(self.count):
+                words = normalizer.words(page["text"] for page in self.record(i)["pages"])
+                stems.add(" ".join(sorted(words)))
+            stems.close()
+            replace(osp.join(self.folder, name + ".tmp.bin"), path + ".bin")
+            # the index goes last, it marks the words as complete
+            replace(osp.join(self.folder, name + ".tmp.idx"), path + ".idx")
+        return map_offsets(path + ".idx"), map_bytes(path + ".bin")
@@ -0,0 +1,38 @@
+"""HTTP helpers shared by the fetch scripts
+
+One session per crawl with a connection pool as big as the number of
+worker threads, and JSON requests with a timeout that are retried with
+exponential backoff when the server or the network has trouble.
+"""
+
+from time import sleep
+from requests import Session
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException, HTTPError
+
+
+def make_session(workers):
+    """A session that keeps up to workers connections open per host"""
+    session = Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(1, workers))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_json(session, url, timeout=30, retries=3, backoff=0.5):
+    """GET url and decode the JSON, retrying server errors and timeouts"""
+    for attempt in range(retries + 1):
+        try:
+            resp = session.get(url, timeout=timeout)
+            resp.raise_for_status()
+            return resp.json()
+        except HTTPError as e:
+            # a client error will not get better by asking again
+            status = e.response.status_code
+            if (status != 429 and status < 500) or attempt == retries:
+                raise
+        except (RequestException, ValueError):
+            if attempt == retries:
+                raise
+        sleep(backoff * 2 ** attempt)
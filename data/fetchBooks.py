@@ -1,35 +1,63 @@
-"""fetch all the thr books"""
-import requests
+"""fetch all the thr books
+
+Search pages are walked in order while the books they list are fetched
+by a pool of threads sharing one session. Books are kept in
+allbooks.sqlite, committed in batches, along with the first search page
+that is not completely stored yet, so an interrupted crawl started again
+with the same search picks up at that page. A crawl that gets to the last
+page or to stop forgets that page, so the next one walks every page again
+and finds the books added since. An explicit start= overrides a saved page.
+
+python3 fetchBooks.py books.json.gz stop=100 workers=16 host=http://localhost:8000
+"""
+from concurrent.futures import ThreadPoolExecutor
 from sqlitedict import SqliteDict
 import gzip
 import json
 import sys
+from crawl import make_session, get_json
 
 
+def fetch_books(start=None, stop=2, search="", cat="", reviewed="", audience="", lang="",
+                author="DLM", host="http://test.tarheelreader.org", workers=8,
+                timeout=30, retries=3, commit_every=100, db="allbooks.sqlite"):
+    books = SqliteDict(db)
+    progress = SqliteDict(db, tablename="progress", autocommit=True)
+    query = f"search={search}&category={cat}&reviewed={reviewed}&audience={audience}&language={lang}"
+    # resume where an interrupted crawl of the same search stopped
+    checkpoint = f"{host}/find/?{query}|{author}"
+    start = int(start) if start is not None else progress.get(checkpoint, 1)
+    stop = int(stop)
+    workers = int(workers)
+    fetched = 0
+    with make_session(workers) as s, ThreadPoolExecutor(workers) as pool:
+        def get_book(slug):
+            url = f"{host}/book-as-json/?slug={slug}"
+            return get_json(s, url, timeout=float(timeout), retries=int(retries))
 
-def fetch_books(start=1, stop=2, search="", cat="", reviewed="", audience="", lang=""):
-    books = SqliteDict("allbooks.sqlite", autocommit=True)
-    with requests.Session() as s:
-        for page in range(int(start), int(stop)):
+        for page in range(start, stop):
             sys.stdout.write(f"Page: {page}\r")
-            url = (
-                "http://test.tarheelreader.org/find/"
-                f"?search={search}&category={cat}&reviewed={reviewed}&audience={audience}&language={lang}&"
-                f"page={page}&json=1"
-            )
-            resp = s.get(url)
-            r = resp.json()
-            for b in r["books"]:
-                if b["slug"] in books:
-                    continue
-                if b["author"] != "DLM":
-                    continue
-                url = "http://test.tarheelreader.org/book-as-json/" f'?slug={b["slug"]}'
-                resp = s.get(url)
-                book = resp.json()
-                books[b["slug"]] = book
-                if not r["more"]:
-                    break
+            url = f"{host}/find/?{query}&page={page}&json=1"
+            r = get_json(s, url, timeout=float(timeout), retries=int(retries))
+            slugs = [
+                b["slug"] for b in r["books"]
+                if b["slug"] not in books and (not author or b["author"] == author)
+            ]
+            for slug, book in zip(slugs, pool.map(get_book, slugs)):
+                books[slug] = book
+                fetched += 1
+                if fetched % int(commit_every) == 0:
+                    books.commit()
+            books.commit()
+            if not r["more"]:
+                break
+            # every book on this page is stored, so a crawl cut short resumes after it
+            progress[checkpoint] = page + 1
+    # the crawl is complete, the next one starts from the first page
+    if checkpoint in progress:
+        del progress[checkpoint]
+    progress.close()
+    print(f"Fetched {fetched} books, {len(books)} in {db}")
     return books
 
 def main():
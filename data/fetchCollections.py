@@ -1,45 +1,76 @@
-from requests import Session
-from gzip import open as gzip_open
-from json import dump
+"""fetch the thr collections and the books in each one
+
+Collection pages are fetched a window at a time by a pool of threads
+sharing one session until a page says there are no more. The book lists
+of each window of collections are fetched by the same pool and are
+written to collections.json.gz before the next window is asked for. Only
+one window of collections is held at a time, and the file comes out in
+the same order as before.
 
+python3 fetchCollections.py workers=16 host=http://localhost:8000 favorites=http://localhost:8000
+"""
+from concurrent.futures import ThreadPoolExecutor
+from gzip import open as gzip_open
+from itertools import count
+from json import dumps
+from os import replace
+import sys
+from crawl import make_session, get_json
 
-def main():
-    idx = 1
-    collections = []
-    with Session() as sess:
-        while True:
-            resp = sess.get(
-                f'http://test.tarheelreader.org/collections?cpage={idx}&json=1')
-            resp_json = resp.json()
 
+def collection_windows(sess, pool, host, workers, **kw):
+    """Yield the collections listed, a window of pages at a time in page order"""
+    pages = count(1)
+    while True:
+        window = [next(pages) for _ in range(workers)]
+        urls = [f'{host}/collections?cpage={idx}&json=1' for idx in window]
+        collections = []
+        for resp_json in pool.map(lambda url: get_json(sess, url, **kw), urls):
             if not resp_json['has_collections']:
-                break
+                yield collections
+                return
+            collections.extend(resp_json['collections'])
+        yield collections
 
-            collections = collections + resp_json['collections']
 
-            idx += 1
-    
-    slugs = [collect['slug'] for collect in collections]
+def main(host='http://test.tarheelreader.org', favorites='https://tarheelreader.org',
+         out='collections.json.gz', workers=8, timeout=30, retries=3):
+    workers = int(workers)
+    kw = dict(timeout=float(timeout), retries=int(retries))
+    written = set()
 
-    collections_map = {c['slug'] : c for c in collections}
-    
-    with Session() as sess:
-        for slug in slugs:
-            resp = sess.get(f'https://tarheelreader.org/favorites/?collection={slug}&json=1')
-            resp_json = resp.json()
-            
-            books = resp_json['books']
+    with make_session(workers) as sess, ThreadPoolExecutor(workers) as pool:
+        def book_slugs(slug):
+            url = f'{favorites}/favorites/?collection={slug}&json=1'
+            return [b['slug'] for b in get_json(sess, url, **kw)['books']]
 
-            book_slugs = [b['slug'] for b in books]
+        # the last good file stays until this one is complete
+        with gzip_open(out + ".tmp", "wt", encoding="utf-8") as fp:
+            fp.write('{')
+            for collections in collection_windows(sess, pool, host, workers, **kw):
+                # a collection listed on two pages is written the first time
+                fresh = {}
+                for c in collections:
+                    if c['slug'] not in written:
+                        fresh.setdefault(c['slug'], c)
+                for slug, slugs in zip(fresh, pool.map(book_slugs, fresh)):
+                    fresh[slug]['book_slugs'] = slugs
+                    fp.write(('' if not written else ', ') + dumps(slug) + ': ' + dumps(fresh[slug]))
+                    written.add(slug)
+            fp.write('}')
+        replace(out + ".tmp", out)
+    print(f'Fetched {len(written)} collections into {out}')
 
-            collections_map[slug]['book_slugs'] = book_slugs
-    
-    with gzip_open('collections.json.gz', "wt", encoding="utf-8") as fp:
-        dump(collections_map, fp)
-    
 
-    
+def parse_args():
+    args = {}
+    for a in sys.argv[1:]:
+        xs = a.split("=", 1)
+        if len(xs) != 2:
+            sys.exit(1)
+        args[xs[0]] = xs[1]
+    return args
 
 
 if __name__ == '__main__':
-    main()
+    main(**parse_args())
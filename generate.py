@@ -4,27 +4,30 @@ Experiment with allowing variable base
 """
 
 from gzip import open as gzip_open
-from json import load as json_load, dump as json_dump
-from mako.template import Template
-from mako import exceptions
-from os import makedirs
+from json import load as json_load, dumps as json_dumps
+from os import makedirs, replace
 import os.path as osp
 from itertools import groupby as itertools_groupby
-from shutil import copyfileobj
-from re import findall as regex_findall, IGNORECASE, split as regex_split, match as regex_match, escape as regex_escape
-from requests import Session
-from nltk.stem.porter import PorterStemmer
-from nltk.corpus import stopwords
-from nltk import download as nltk_download, pos_tag, word_tokenize
-from contractions import fix as contractions_fix
-from pandas import DataFrame
+from shutil import rmtree
 import myArgs
 from math import ceil, log
-from sqlitedict import SqliteDict
 from copypage import CopyPage
-from string import punctuation
-from spellchecker import SpellChecker
-import bookspellchecker
+from manifest import BuildManifest, digest
+import bookstream
+from corpuscache import CorpusCache
+from buildstats import BuildStats
+from idregistry import IdRegistry
+from prune import prune_index
+from textnorm import WordNormalizer
+from records import BookRecord
+import wordindex
+from imagefetch import ImageFetcher
+from imageregistry import ImageRegistry
+from imageopt import ImageOptimizer, thumb_path
+from precompress import Precompressor
+from renderpool import PageWriter, render
+from templates import registry
+import nltkdata
 
 args = myArgs.Parse(
     base=16,  # base to encode books in
@@ -52,65 +55,113 @@ args = myArgs.Parse(
     # where to put a summary of misspelled words
     spellcheckwrongout='data/misspelledwords.txt',
     spellcheckcorrectout='data/correctwords.txt',
+    # file to keep spell check verdicts in between builds
+    spellcheckcache='',
     images="/archives/tarheelreader/production",  # folder for images
+    # how to take pictures from the images folder (hardlink, reflink, copy)
+    # or http to always download them; missing pictures are downloaded
+    imageLink="hardlink",
+    imageWorkers=16,  # number of pictures to download at once
+    imageTimeout=30,  # seconds to wait on the image server before giving up
+    imageRetries=3,  # number of times to retry a failed picture download
+    # recompress pictures and make cover thumbnails for the index pages (needs Pillow)
+    optimizeImages=False,
+    imageQuality=80,  # JPEG quality for optimized pictures and thumbnails
+    thumbSize=200,  # largest side in pixels of a cover thumbnail
+    imageCache="",  # folder to keep optimized pictures in between builds
+    # only rewrite outputs whose inputs changed since the last build in out
+    incremental=True,
+    # keep the IDs of books and pictures from earlier builds in out
+    stableIds=False,
+    spareDigits=1,  # extra ID digits to reserve for growth when stableIds is set
+    workers=1,  # number of processes for spell checking and rendering books
+    # files for one file per word or packed for a few shards with a table
+    indexFormat="files",
+    indexShards=16,  # number of shards in the packed index
+    stemCacheSize=100000,  # most distinct words to remember the stems of
+    stemCache="",  # file to keep the stems in between builds
+    templateCache="",  # folder to keep compiled templates in between builds
+    # also write a cProfile of every stage next to build-stats.json
+    profile=False,
+    # write .gz (and .br with the brotli module) copies of the text outputs
+    precompress=False,
+    precompressMin=1024,  # smallest output in bytes worth precompressing
+    # folder for a preprocessed copy of the books, made by the first build using it
+    corpusCache="",
     # where to find the book archive (generated by using data\fetchBooks)
     books="data/books.json.gz",
     collections="data/collections.json.gz"
 )
 
+registry.module_directory = args.templateCache
 cp = CopyPage()
-
-# get all the books
-books = json_load(gzip_open(args.books, "rt", encoding="utf-8"))
-
-
-def render(template, view):
-    """Render a template with traceback"""
-    try:
-        html = Template(template).render(**view)
-    except Exception:
-        print(exceptions.text_error_template().render())
-        raise
-    return html
-
+stats = BuildStats(profile=args.profile)
 
 def matchesQuery(book, query):
     """True if the query occurs in the book"""
+    pages = book["pages"]
     return (
         query in book["author"]
         or query in book["title"]
-        or any(query in page["text"] for page in book["pages"])
+        # cached pages can search their text without reading it all out
+        or (pages.search(query) if hasattr(pages, "search")
+            else any(query in page["text"] for page in pages))
     )
 
 
-# get the books that qualify
-books = [
-    book
-    for book in books
-    # is the specified language (English default)
-    if book["language"] == args.lang
-    # satisfies the query if any
-    and (not args.query or matchesQuery(book, args.query))
-    # is categorized
-    and (not args.hasCat or len(book["categories"]) > 0)
-    # has an audience
-    and (not args.hasAudience or book["audience"] in "EC")
-    # has enough pages or is reviewed
-    and ((args.minPages <= len(book["pages"]) <= args.maxPages) or book["reviewed"])
-]
+def qualifies(book):
+    """True if the book can be selected"""
+    return (
+        # is the specified language (English default)
+        book["language"] == args.lang
+        # satisfies the query if any
+        and (not args.query or matchesQuery(book, args.query))
+        # is categorized
+        and (not args.hasCat or len(book["categories"]) > 0)
+        # has an audience
+        and (not args.hasAudience or book["audience"] in "EC")
+        # has enough pages or is reviewed
+        and ((args.minPages <= len(book["pages"]) <= args.maxPages) or book["reviewed"])
+    )
+
+
+# only the first Nselect reviewed and unreviewed books are used, so without
+# spell checking to drop some of them we can stop reading once we have those
+wanted = {True: args.Nselect, False: args.Nselect}
 
-# get stop words (the, is, are, etc.)
-nltk_download('stopwords')
-stop_words = set(stopwords.words('english'))
 
-spell = SpellChecker()
+def enough(book):
+    """count the book and say if we have all we can use"""
+    wanted[bool(book["reviewed"])] -= 1
+    return not args.spellcheck and max(wanted.values()) <= 0
 
 
+# get the books that qualify as they are read
+stats.stage("load")
+if args.corpusCache:
+    corpus = CorpusCache(args.corpusCache, args.books)
+    books, books_read = corpus.load_books(qualifies, enough)
+else:
+    corpus = None
+    books, books_read = bookstream.load_books(args.books, qualifies, enough)
+print(f'Read {books_read} books')
+stats.items(books_read)
+
+# get stop words (the, is, are, etc.)
+stats.stage("stopwords")
+stop_words = nltkdata.stop_words('english')
+stats.items(len(stop_words))
+
 if args.spellcheck:
+    stats.stage("spellcheck")
+    # the spell checker and its dictionaries take a while to load
+    import bookspellchecker
+
     book_spell = bookspellchecker.BookSpellCheck(
-        spellcheckdata=args.spellcheckdata, stop_words=stop_words)
+        spellcheckdata=args.spellcheckdata, stop_words=stop_words,
+        cache_path=args.spellcheckcache or None)
     books, set_unknown, set_known = book_spell.spellcheck(
-        books, mode=args.spellcheckmode)
+        books, mode=args.spellcheckmode, workers=args.workers)
 
     if args.spellcheckdata:
         print(
@@ -123,8 +174,10 @@ if args.spellcheck:
         with open(args.spellcheckcorrectout, "wt", encoding="utf-8") as fp:
             fp.write('\n'.join(sorted(set_known)))
 
+    stats.items(len(books))
 
 print('Number of books that qualify: ', len(books))
+stats.stage("words")
 
 # break into reviewed and unreviewed
 reviewed = [book for book in books if book["reviewed"]][: args.Nselect]
@@ -132,77 +185,61 @@ unreviewed = [book for book in books if not book["reviewed"]][: args.Nselect]
 # reviewed books come first
 selected = reviewed + unreviewed
 
-# spell = Spellchecker()
+# activate stemmer, only this stage needs nltk
+from nltk.stem.porter import PorterStemmer
 
-# activate stemmer
 stemmer = PorterStemmer()
 
 
-def getWords(book, stemmer):
+normalizer = WordNormalizer(
+    stemmer, stop_words, size=args.stemCacheSize, path=args.stemCache)
+
+
+def getWords(book):
     """Return words from the book
 
     replace contractions
-    check spelling
+    drop stop words
     stem
     """
-    words = []
-    for page in book["pages"]:
-        text = contractions_fix(page["text"])
-        text = text.replace("'", "")
-        words += [
-            stemmer.stem(word).lower()
-            for word in regex_findall(r"[a-z]+", text, flags=IGNORECASE)
-            # spell.known(words=[word]) and
-            if word.lower() not in stop_words
-        ]
-
-    return set(words)
+    if corpus:
+        return corpus.words(book["slug"], normalizer)
+    return normalizer.words(page["text"] for page in book["pages"])
 
 
 index = []
 for book in selected:
     slug = book["slug"]
-    words = getWords(book, stemmer)
+    words = getWords(book)
     for word in words:
         index.append((word, slug))
     for category in book["categories"]:
         index.append((category.upper(), slug))
     if book["audience"] == "C":
         index.append(("CAUTION", slug))
+normalizer.save()
+print(f'Stem cache hits: {normalizer.hits}, misses: {normalizer.misses}')
 
+print(f'(Words x Slugs): {len(index)}')
+stats.items(len(selected))
+stats.stage("prune")
 
-index = DataFrame(index, columns=['word', 'slug'])
-
-print(f'(Words x Slugs): {index.shape[0]}')
+# drop rare words and books with too few or too many words, repeating
+# because dropping some might change inclusion of others
+wordToSlugs, slugs, prune_stats = prune_index(
+    index, args.minAppearances, args.minWordsPerBook, args.maxWordsPerBook)
 
-# repeat because dropping some might change inclusion of others
-slug_set = set(index.slug.unique())
-word_set = set(index.word.unique())
-while True:
-    # drop the words that only occur a few times
-    booksPerWord = index.groupby("word").slug.count()
-    index = index[index.word.isin(
-        booksPerWord[booksPerWord > args.minAppearances].index)]
-
-    # drop the books that have too few or too many words
-    wordsPerBook = index.groupby("slug").word.count()
-    rightSize = (wordsPerBook >= args.minWordsPerBook) & (
-        wordsPerBook < args.maxWordsPerBook)
-    index = index[index.slug.isin(wordsPerBook[rightSize].index)]
-
-    new_slug_set = set(index.slug.unique())
-    new_word_set = set(index.word.unique())
-    if len(new_slug_set) == len(slug_set) and len(new_word_set) == len(word_set):
-        break
-    slug_set = new_slug_set
-    word_set = new_word_set
+print(
+    f'Pruning took {prune_stats["passes"]} passes and removed '
+    f'{prune_stats["rare_words"]} rare words, '
+    f'{prune_stats["short_books"]} books with too few words and '
+    f'{prune_stats["long_books"]} books with too many words')
 
-# make the index from words to slugs
-wordToSlugs = index.groupby("word").slug.apply(list)
-slugs = index.slug.unique()
+stats.items(len(index))
 
-# only keep the selected books for the rest of the processing
-books = [book for book in books if book["slug"] in slugs]
+# only keep what we need of the selected books for the rest of the processing
+books = [BookRecord(book) for book in books if book["slug"] in slugs]
+del selected, reviewed, unreviewed, index
 Nbooks = len(books)
 Dbooks = int(ceil(log(Nbooks, args.base)))
 
@@ -212,8 +249,7 @@ print(
 # count the pictures
 pictures = set()
 for book in books:
-    for page in book["pages"]:
-        pictures.add(page["url"])
+    pictures.update(book.urls)
 Npictures = len(pictures)
 Dpictures = int(ceil(log(Npictures, args.base)))
 
@@ -222,6 +258,13 @@ print(f'Number of pictures: {Npictures}, or {Dpictures} (in base {args.base})')
 OUT = args.out
 CONTENT = osp.join(OUT, "content")
 
+if args.stableIds:
+    makedirs(OUT, exist_ok=True)
+    id_registry = IdRegistry(osp.join(OUT, "idregistry.json"), args.base, args.spareDigits)
+    id_registry.assign_books([book.slug for book in books])
+    Dbooks = id_registry.book_digits
+    print(f'Stable book IDs use {Dbooks} digits (in base {args.base})')
+
 
 def make_pageid(i):
     """return the fragment for the page"""
@@ -242,6 +285,14 @@ def encode(value, digits):
     return "".join(r[::-1])
 
 
+def decode(string):
+    """Decode a string made by encode back into an integer"""
+    value = 0
+    for char in string:
+        value = value * args.base + encoding.index(char)
+    return value
+
+
 # map slugs to ids
 bookmap = {}
 
@@ -249,7 +300,7 @@ bookmap = {}
 def make_bookid(slug):
     """get unique id for a book"""
     if slug not in bookmap:
-        num_books = len(bookmap)
+        num_books = id_registry.books[slug] if args.stableIds else len(bookmap)
         res_encode = encode(num_books, Dbooks)
         # *list makes the file structure first_digit/second_digit/...last_digit.html
         path = osp.join(CONTENT, *list(res_encode)) + ".html"
@@ -259,70 +310,152 @@ def make_bookid(slug):
 
 # map image URL to new name
 makedirs(OUT, exist_ok=True)
-imagemap = SqliteDict(osp.join(OUT, "imagemap.sd"), autocommit=True)
-
-
-def imgurl(url, bid, bpath, session):
-    """localize and return full image url for a picture"""
-    if url in imagemap:
-        path = imagemap[url]
-    else:
-        num_pictures = len(imagemap)
+manifest = BuildManifest(OUT, incremental=args.incremental)
+# also maps the sha1 of a picture as downloaded to where we stored it
+imagemap = ImageRegistry(osp.join(OUT, "imagemap.sd"))
+if args.stableIds:
+    Dpictures = id_registry.image_digits(len(imagemap) + Npictures)
+    id_registry.save()
+
+
+def localize_images(books):
+    """localize every picture the books need before any rendering starts"""
+    wanted = list(dict.fromkeys(
+        url
+        for book in books
+        for url in book.urls
+        if url not in imagemap
+    ))
+    # download into a staging folder so that failures do not leave holes in
+    # the numbering of the pictures we keep
+    staging = osp.join(OUT, "staging")
+    makedirs(staging, exist_ok=True)
+    jobs = [(url, osp.join(staging, f"{i}.jpg")) for i, url in enumerate(wanted)]
+    failed = fetcher.fetch_all(jobs)
+    # several urls may share a picture so count the pictures, not the urls
+    num_pictures = imagemap.count
+    duplicates = 0
+    saved = 0
+    for url, tmp in jobs:
+        if url in failed:
+            continue
+        with open(tmp, "rb") as fp:
+            key = digest(fp.read())
+        if imagemap.find(key):
+            # the same picture under another url, keep the one we have
+            imagemap.add(url, imagemap.find(key))
+            duplicates += 1
+            saved += osp.getsize(tmp)
+            continue
         res_encode = encode(num_pictures, Dpictures)
         path = osp.join(CONTENT, *res_encode) + ".jpg"
         makedirs(osp.dirname(path), exist_ok=True)
-        try:
-            resp = session.get("http://tarheelreader.org" + url, stream=True)
-        except:
-            return ""
-        with open(path, 'wb') as f:
-            resp.raw.decode_content = True
-            copyfileobj(resp.raw, f)
-        imagemap[url] = path
+        replace(tmp, path)
+        imagemap.add(url, path, key)
+        num_pictures += 1
+    imagemap.flush()
+    rmtree(staging, ignore_errors=True)
+    fetcher.report()
+    placed = len(jobs) - len(failed)
+    ratio = duplicates / placed if placed else 0
+    print(f"Duplicate images: {duplicates} of {placed} ({ratio:.1%}), {saved} bytes saved")
+
+
+def imgurl(url, bpath):
+    """return the local path and the path relative to the book for a picture"""
+    if url not in imagemap:
+        return "", ""
+    path = imagemap[url]
     return path, osp.relpath(path, osp.dirname(bpath))
 
 
+def thumburl(url, bpath):
+    """like imgurl but for the cover thumbnail when there is one"""
+    path, rel = imgurl(url, bpath)
+    if path not in thumbs:
+        return path, rel
+    path = thumb_path(path)
+    return path, osp.relpath(path, osp.dirname(bpath))
+
+
+stats.stage("images")
+fetcher = ImageFetcher(
+    workers=args.imageWorkers,
+    timeout=args.imageTimeout,
+    retries=args.imageRetries,
+    archive=args.images,
+    link=args.imageLink,
+)
+localize_images(books)
+stats.items(Npictures)
+
+# covers that have a thumbnail
+thumbs = set()
+if args.optimizeImages:
+    stats.stage("optimize")
+    optimizer = ImageOptimizer(OUT, args.imageQuality, args.thumbSize, args.imageCache, args.workers)
+    covers = [imagemap[book.urls[0]] for book in books if book.urls[0] in imagemap]
+    # the archive copies a picture may have come from, to start again from its original
+    sources = {}
+    if fetcher.archive:
+        for book in books:
+            for url in book.urls:
+                if url in imagemap:
+                    sources.setdefault(imagemap[url], set()).add(
+                        osp.join(fetcher.archive, url.lstrip("/")))
+    optimizer.run([imagemap[url] for book in books for url in book.urls
+                   if url in imagemap], covers, sources)
+    if optimizer.available:
+        thumbs.update(covers)
+        optimizer.save()
+        optimizer.report()
+        stats.items(optimizer.optimized)
+
 # write the books copying the images
+stats.stage("books")
 ndx = []
-template = open("src/book.mako").read()
+template = "src/book.mako"
+template_key = digest(open(template).read())
 lastReviewed = None
+last = None
 
 book_css = osp.join(OUT, cp.copy("book.css"))
 book_js = osp.join(OUT, cp.link("book.js"))
 
+book_writer = PageWriter(workers=args.workers)
+
 progress_counter = len(books)//10
 slugs_not_found = set()
 for progress, book in enumerate(books):
-    bid, bpath = make_bookid(book["slug"])
+    bid, bpath = make_bookid(book.slug)
 
-    books[progress]['id'] = bid
-    books[progress]['link'] = bpath
+    book.id = bid
+    book.link = bpath
 
     if progress % progress_counter == 0:
         print(
             f"Template making progress: {progress}, book ID {bid}, book path {bpath}")
     icons = []
-    if book["audience"] == "C":
+    if book.audience == "C":
         icons.append("C")
-    if book["reviewed"]:
+    if book.reviewed:
         icons.append("R")
-        lastReviewed = bid
-    last = bid
+        lastReviewed = max(lastReviewed or bid, bid)
+    last = max(last or bid, bid)
     ipath = osp.join(osp.dirname(bpath), "index.html")
-    sess = Session()
 
-    title_image_path, title_image = imgurl(book['pages'][0]['url'], bid, bpath, sess)
+    title_image_path, title_image = thumburl(book.urls[0], bpath)
     if not title_image:
-        slugs_not_found.add(book['slug'])
+        slugs_not_found.add(book.slug)
         continue
 
-    books[progress]['image'] = title_image_path
+    book.image = title_image_path
 
     ndx.append(
         dict(
-            title=book["title"],
-            author=book["author"],
-            pages=len(book["pages"]),
+            title=book.title,
+            author=book.author,
+            pages=len(book.urls),
             image=title_image,
             icons=" ".join(icons),
             id=bid,
@@ -331,18 +464,18 @@ for progress, book in enumerate(books):
         )
     )
     view = dict(start="#" + make_pageid(1),
-                title=book["title"], index=f"./#{bid}")
+                title=book.title, index=f"./#{bid}")
 
-    _, second_image = imgurl(book['pages'][1]['url'], bid, bpath, sess)
+    _, second_image = imgurl(book.urls[1], bpath)
     if not second_image:
-        slugs_not_found.add(book['slug'])
+        slugs_not_found.add(book.slug)
         continue
 
     pages = [
         dict(
-            title=book["title"],
-            author=book["author"],
-            image=imgurl(book["pages"][1]["url"], bid, bpath, sess)[1],
+            title=book.title,
+            author=book.author,
+            image=second_image,
             id=make_pageid(1),
             back=view["index"],
             next="#" + make_pageid(2),
@@ -350,12 +483,12 @@ for progress, book in enumerate(books):
     ]
 
     image_not_found = False
-    for i, page in enumerate(book["pages"][1:]):
+    for i, (text, url) in enumerate(zip(book.texts[1:], book.urls[1:])):
         pageno = i + 2
-        curr_image = imgurl(page['url'], bid, bpath, sess)[1]
+        curr_image = imgurl(url, bpath)[1]
 
         if not curr_image:
-            slugs_not_found.add(book['slug'])
+            slugs_not_found.add(book.slug)
             image_not_found = True
             break
 
@@ -364,7 +497,7 @@ for progress, book in enumerate(books):
                 pageno=pageno,
                 id=make_pageid(pageno),
                 image=curr_image,
-                text=page["text"],
+                text=text,
                 back="#" + make_pageid(pageno - 1),
                 next="#" + make_pageid(pageno + 1),
             )
@@ -379,25 +512,27 @@ for progress, book in enumerate(books):
     view["css"] = osp.relpath(book_css, osp.dirname(bpath))
     view["js"] = osp.relpath(book_js, osp.dirname(bpath))
 
-    html = render(template, view)
-    makedirs(osp.dirname(bpath), exist_ok=True)
-    with open(bpath, "wt", encoding="utf-8") as fp:
-        fp.write(html)
+    if manifest.stale(bpath, digest(template_key, view)):
+        book_writer.add(template, view, bpath)
 
-books = [book for book in books if book['slug'] not in slugs_not_found]
-
-books_by_title = sorted(books, key=lambda k: k['title'])
-books_by_author = sorted(books, key=lambda k: k['author'])
+written = book_writer.run()
+print(f'Rendered {written} book pages with {args.workers} workers')
+stats.items(written)
 
+# the pages are written so the texts can go
 for book in books:
-    book['average_rating'] = book['rating_total'] / \
-        book['rating_count'] if book['rating_count'] > 0 else 0
+    book.drop_texts()
+
+books = [book for book in books if book.slug not in slugs_not_found]
+stats.stage("sort")
 
-books_by_rating = sorted(books, key=lambda k: k['average_rating'])
-books_by_rating_count = sorted(books, key=lambda k: k['rating_total'])
+books_by_title = sorted(books, key=lambda k: k.title)
+books_by_author = sorted(books, key=lambda k: k.author)
+books_by_rating = sorted(books, key=lambda k: k.average_rating)
+books_by_rating_count = sorted(books, key=lambda k: k.rating_total)
 
 
-def get_id_for_book(k): return bookmap[k['slug']][0]
+def get_id_for_book(k): return bookmap[k.slug][0]
 
 
 books_by_title = list(map(get_id_for_book, books_by_title))
@@ -407,53 +542,58 @@ books_by_rating_count = list(map(get_id_for_book, books_by_rating_count))
 
 # write the sort indexes
 SORTOUT = osp.join(CONTENT, "sort")
-makedirs(SORTOUT, exist_ok=True)
-with open(osp.join(SORTOUT, "title"), "wt", encoding="utf-8") as fp:
-    fp.write(''.join(books_by_title))
 
-with open(osp.join(SORTOUT, "author"), "wt", encoding="utf-8") as fp:
-    fp.write(''.join(books_by_author))
 
-with open(osp.join(SORTOUT, "rating"), "wt", encoding="utf-8") as fp:
-    fp.write(''.join(books_by_rating))
+def write_text(path, text):
+    """write a small output through the manifest keyed by its own content"""
+    manifest.write(path, digest(text), text)
 
-with open(osp.join(SORTOUT, "ratingcount"), "wt", encoding="utf-8") as fp:
-    fp.write(''.join(books_by_rating_count))
 
-print("Last Reviewed", lastReviewed)
+write_text(osp.join(SORTOUT, "title"), ''.join(books_by_title))
+write_text(osp.join(SORTOUT, "author"), ''.join(books_by_author))
+write_text(osp.join(SORTOUT, "rating"), ''.join(books_by_rating))
+write_text(osp.join(SORTOUT, "ratingcount"), ''.join(books_by_rating_count))
 
-
-def filter_slugs(book_slugs_collection, book_slugs_given):
-    return any([b in book_slugs_given for b in book_slugs_collection])
+print("Last Reviewed", lastReviewed)
 
 
 # work on collections
+stats.stage("collections")
 collections = json_load(gzip_open(args.collections, "rt", encoding="utf-8"))
-collections = {key: value for key, value in collections.items() if filter_slugs(
-    value['book_slugs'], bookmap.keys())}
-for slug in collections:
-    collections[slug]['book_slugs'] = list(
-        filter(lambda k: k in bookmap.keys(), collections[slug]['book_slugs']))
+# keep the collections with at least one of our books
+for slug in list(collections):
+    book_slugs = [k for k in collections[slug]['book_slugs'] if k in bookmap]
+    if book_slugs:
+        collections[slug]['book_slugs'] = book_slugs
+    else:
+        del collections[slug]
 
-collection_template = open('src/collections.mako').read()
+# the books that made it, and their order in books
+book_by_slug = {book.slug: book for book in books}
+book_position = {book.slug: i for i, book in enumerate(books)}
+
+collection_template = 'src/collections.mako'
+collection_key = digest(open(collection_template).read())
 collection_path = osp.join(OUT, "collections")
 
 collection_css = osp.join(OUT, cp.copy("collections.css"))
 
 makedirs(collection_path, exist_ok=True)
+collection_writer = PageWriter(workers=args.workers)
 
 all_collections = [key + ',' + '-'.join(item['title'].split(' ')) for key, item in collections.items()]
 for slug, val in collections.items():
     path = osp.join(collection_path, slug + '.html')
     book_collection = []
-    for book in [book for book in books if book['slug'] in val['book_slugs']]:
+    members = sorted(set(val['book_slugs']) & book_by_slug.keys(), key=book_position.get)
+    for book in map(book_by_slug.get, members):
         book_collection.append(
             dict(
-                id=book['id'],
-                link=book['link'],
-                title=book['title'],
-                author=book['author'],
-                image=book['image']
+                id=book.id,
+                link=book.link,
+                title=book.title,
+                author=book.author,
+                image=book.image
             )
         )
 
@@ -467,15 +607,21 @@ for slug, val in collections.items():
         back='/',
         css=osp.relpath(collection_css, path)
     )
-    with open(path, 'wt', encoding='utf-8') as fp:
-        fp.write(render(collection_template, view))
+    if manifest.stale(path, digest(collection_key, view)):
+        collection_writer.add(collection_template, view, path)
+
+collection_writer.run()
+stats.items(len(collections))
 
 # write out an all collections file
-with open(osp.join(collection_path, 'ALL'), 'wt', encoding='utf-8') as fp:
-    fp.write(' '.join(all_collections))
+write_text(osp.join(collection_path, 'ALL'), ' '.join(all_collections))
 
 # write the index.htmls
-idxtemplate = open("src/book-index.mako").read()
+stats.stage("book-index")
+idxtemplate = "src/book-index.mako"
+idxtemplate_key = digest(open(idxtemplate).read())
+# stable IDs come out in corpus order, the grouping needs them in ID order
+ndx.sort(key=lambda v: v["id"])
 idxpaths = sorted(set(b["path"] for b in ndx))
 start = osp.join(CONTENT, "index.html")
 back = start
@@ -483,47 +629,68 @@ i = 1
 for path, group in itertools_groupby(ndx, lambda v: v["path"]):
     view = dict(
         name="index",
-        books=group,
+        books=list(group),
         back=osp.relpath(back, osp.dirname(path)),
         next=osp.relpath(idxpaths[i] if i < len(idxpaths)
                          else start, osp.dirname(path)),
         css=osp.relpath(osp.join(OUT, "index.css"), path),
     )
-    with open(path, "wt", encoding="utf-8") as fp:
-        fp.write(render(idxtemplate, view))
+    manifest.write(path, digest(idxtemplate_key, view),
+                   lambda: render(idxtemplate, view))
     back = path
     i += 1
 
+stats.items(len(idxpaths))
+
 # write the word indexes
+stats.stage("word-index")
 WOUT = osp.join(CONTENT, "index")
-makedirs(WOUT, exist_ok=True)
 
-for word, slugs in wordToSlugs.iteritems():
+postings = {}
+for word, slugs in wordToSlugs.items():
     if len(word) < 3:
         continue
     # bookmap[slug] is a tuple whose structure is (book ID, book path)
     ids = sorted([bookmap[slug][0] for slug in slugs])
-    with open(osp.join(WOUT, word), "wt", encoding="utf-8") as fp:
-        fp.write("".join(ids))
+    if args.indexFormat == "packed":
+        postings[word] = [decode(bid) for bid in ids]
+    else:
+        write_text(osp.join(WOUT, word), "".join(ids))
+
+if args.indexFormat == "packed":
+    # make sure CAUTION exists
+    postings.setdefault("CAUTION", [])
+    shards, table = wordindex.pack(postings, args.indexShards)
+    for i, shard in enumerate(shards):
+        manifest.write(osp.join(WOUT, f"shard{i}.bin"), digest(shard), shard)
+    write_text(osp.join(WOUT, "table.json"), json_dumps(table))
+    print(f'Packed {len(postings)} terms into {len(shards)} shards')
 
 all_words = ' '.join(filter(lambda word: word.upper()
                             != word, wordToSlugs.keys()))
 print(f'All Words: {all_words}')
-with open(osp.join(WOUT, "ALLWORDS"), "wt", encoding="utf-8") as fp:
-    fp.write(all_words)
+write_text(osp.join(WOUT, "ALLWORDS"), all_words)
 
 # make sure CAUTION exists
-with open(osp.join(WOUT, "CAUTION"), "at", encoding="utf-8") as fp:
-    fp.write("")
+if args.indexFormat != "packed" and "CAUTION" not in wordToSlugs:
+    write_text(osp.join(WOUT, "CAUTION"), "")
 
 # write the AllAvailable file
-with open(osp.join(WOUT, "AllAvailable"), "wt", encoding="utf-8") as fp:
+if args.stableIds:
+    # stable IDs have gaps so list them
+    write_text(osp.join(WOUT, "AllAvailable"), "".join(
+        sorted(bookmap[book.slug][0] for book in books)))
+else:
     # first-last
-    fp.write("%s-%s" % ("0" * Dbooks, last))
+    write_text(osp.join(WOUT, "AllAvailable"), "%s-%s" % ("0" * Dbooks, last))
 
 # write out a list of the images for possible prefetch...
-with open(osp.join(CONTENT, "images.json"), "wt", encoding="utf-8") as fp:
-    json_dump([osp.relpath(path, OUT) for path in imagemap.values()], fp)
+pictures = []
+for path in imagemap.paths:
+    pictures.append(osp.relpath(path, OUT))
+    if path in thumbs:
+        pictures.append(osp.relpath(thumb_path(path), OUT))
+write_text(osp.join(CONTENT, "images.json"), json_dumps(pictures))
 
 # record parameters needed by the js
 config = {
@@ -533,6 +700,21 @@ config = {
     "lastReviewed": lastReviewed,
     "last": last,
 }
+if args.indexFormat == "packed":
+    config["index"] = "packed"
 print(f'Configuration Parameters: {config}')
-with open(osp.join(CONTENT, "config.json"), "wt") as fp:
-    json_dump(config, fp)
+write_text(osp.join(CONTENT, "config.json"), json_dumps(config))
+
+stats.items(len(wordToSlugs))
+
+stats.stage("manifest")
+manifest.save()
+
+if args.precompress:
+    stats.stage("precompress")
+    precompressor = Precompressor(OUT, args.precompressMin, max(args.workers, 4)).run()
+    precompressor.report()
+    stats.items(precompressor.written)
+
+stats.save(OUT)
+stats.report()
@@ -0,0 +1,69 @@
+"""Keep book and picture IDs stable from one build to the next
+
+Numbering by position means adding or removing one book renames every book
+after it, which throws away everything browsers, the service worker and
+mirrors have cached. The registry remembers the number given to each slug
+and only hands out new numbers to new books. Spare digits are reserved so
+the collection can grow for a while before the IDs have to get longer.
+"""
+
+from json import load as json_load, dump as json_dump
+from math import ceil, log
+from os import replace
+import os.path as osp
+
+
+class IdRegistry:
+    """Persistent slug to number map"""
+
+    def __init__(self, path, base, spare=1):
+        self.path = path
+        self.base = base
+        self.spare = spare
+        self.state = dict(base=base, book_digits=0, next_book=0, books={}, image_digits=0)
+        if osp.exists(path):
+            with open(path, "rt", encoding="utf-8") as fp:
+                state = json_load(fp)
+            if state["base"] == base:
+                self.state = state
+            else:
+                print(f"Base changed from {state['base']} to {base}, renumbering all books")
+
+    @property
+    def books(self):
+        return self.state["books"]
+
+    @property
+    def book_digits(self):
+        return self.state["book_digits"]
+
+    def digits_for(self, count):
+        """digits needed to number count items with room to spare"""
+        return int(ceil(log(max(count, 2), self.base))) + self.spare
+
+    def assign_books(self, slugs):
+        """Give each slug a number, keeping the ones from earlier builds"""
+        state = self.state
+        new = [slug for slug in dict.fromkeys(slugs) if slug not in state["books"]]
+        if state["next_book"] + len(new) > self.base ** state["book_digits"]:
+            if state["books"]:
+                print("Book IDs ran out of spare digits, renumbering all books")
+            state["books"] = {}
+            state["next_book"] = 0
+            state["book_digits"] = self.digits_for(len(slugs))
+            new = list(dict.fromkeys(slugs))
+        for slug in new:
+            state["books"][slug] = state["next_book"]
+            state["next_book"] += 1
+
+    def image_digits(self, count):
+        """digits for numbering count pictures, never fewer than last time"""
+        if self.base ** self.state["image_digits"] < count:
+            self.state["image_digits"] = self.digits_for(count)
+        return self.state["image_digits"]
+
+    def save(self):
+        """Write the registry for the next build"""
+        with open(self.path + ".tmp", "wt", encoding="utf-8") as fp:
+            json_dump(self.state, fp)
+        replace(self.path + ".tmp", self.path)
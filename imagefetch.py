@@ -0,0 +1,161 @@
+"""Localize book pictures concurrently
+
+All downloads share one session whose connection pool is sized to the number
+of worker threads, so a build reuses a handful of connections instead of
+opening new ones for every book.
+
+When the production archive is mounted on the build machine, pictures are
+linked out of it (hardlink, reflink or plain copy) and the server is only
+asked for the ones the archive does not have. requests is only imported
+once a picture has to be downloaded.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from os import replace, remove, link as os_link
+import os.path as osp
+from shutil import copyfileobj, copyfile
+from threading import Lock
+from time import perf_counter, sleep
+
+try:
+    from fcntl import ioctl
+except ImportError:  # not on a unix
+    ioctl = None
+
+# from linux/fs.h, clone the extents of one file into another
+FICLONE = 0x40049409
+
+LINK_MODES = ("hardlink", "reflink", "copy", "http")
+
+
+def reflink(src, dst):
+    """Share the blocks of src with dst on filesystems that support it"""
+    if ioctl is None:
+        raise OSError("reflink is not supported here")
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+
+class ImageFetcher:
+    """Download pictures in parallel with timeouts and retries"""
+
+    def __init__(self, host="http://tarheelreader.org", workers=16, timeout=30, retries=3, backoff=0.5,
+                 archive=None, link="hardlink"):
+        if link not in LINK_MODES:
+            raise ValueError(f"link must be one of {', '.join(LINK_MODES)}")
+        self.host = host
+        self.archive = archive if link != "http" and archive and osp.isdir(archive) else None
+        self.link = link
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._session = None
+        self._session_lock = Lock()
+        self.linked = 0
+        self.fetched = 0
+        self.failed = 0
+        self.bytes = 0
+        self.elapsed = 0.0
+
+    @property
+    def session(self):
+        """The session for downloads, made when the first one starts"""
+        with self._session_lock:
+            if self._session is None:
+                from requests import Session
+                from requests.adapters import HTTPAdapter
+
+                self._session = Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+                self._session.mount("http://", adapter)
+                self._session.mount("https://", adapter)
+            return self._session
+
+    def download(self, url, path):
+        """Copy one picture from the server to path, return its size"""
+        tmp = path + ".part"
+        with self.session.get(self.host + url, stream=True, timeout=self.timeout) as resp:
+            resp.raise_for_status()
+            resp.raw.decode_content = True
+            with open(tmp, "wb") as fp:
+                copyfileobj(resp.raw, fp)
+        replace(tmp, path)
+        return osp.getsize(path)
+
+    def local(self, url, path):
+        """Take a picture from the archive, return its size or None if missing"""
+        src = osp.join(self.archive, url.lstrip("/"))
+        if not osp.isfile(src):
+            return None
+        if osp.exists(path):
+            remove(path)
+        try:
+            if self.link == "hardlink":
+                os_link(src, path)
+            elif self.link == "reflink":
+                reflink(src, path)
+            else:
+                copyfile(src, path)
+        except OSError:
+            # different device or no reflink support, fall back to a copy
+            copyfile(src, path)
+        return osp.getsize(src)
+
+    def fetch(self, url, path):
+        """Localize one picture, return (size, from archive) or None on failure"""
+        if self.archive:
+            size = self.local(url, path)
+            if size is not None:
+                return size, True
+        size = self.get(url, path)
+        return None if size is None else (size, False)
+
+    def get(self, url, path):
+        """Download with retries, return the size or None on failure"""
+        from requests.exceptions import RequestException, HTTPError
+
+        for attempt in range(self.retries + 1):
+            try:
+                return self.download(url, path)
+            except HTTPError as e:
+                # only server side trouble is worth another try
+                status = e.response.status_code
+                if status != 429 and status < 500:
+                    break
+            except (RequestException, OSError):
+                pass
+            if attempt < self.retries:
+                sleep(self.backoff * 2 ** attempt)
+        if osp.exists(path + ".part"):
+            remove(path + ".part")
+        return None
+
+    def fetch_all(self, jobs):
+        """Fetch a list of (url, path) pairs, return the urls that failed"""
+        start = perf_counter()
+        failed = set()
+        with ThreadPoolExecutor(self.workers) as pool:
+            results = pool.map(lambda job: self.fetch(*job), jobs)
+            for (url, _), result in zip(jobs, results):
+                if result is None:
+                    failed.add(url)
+                    self.failed += 1
+                    continue
+                size, local = result
+                if local:
+                    self.linked += 1
+                else:
+                    self.fetched += 1
+                    self.bytes += size
+        self.elapsed += perf_counter() - start
+        return failed
+
+    def report(self):
+        """Print the totals for this build"""
+        rate = self.bytes / self.elapsed if self.elapsed else 0
+        print(
+            f"Images linked from archive: {self.linked}, "
+            f"fetched: {self.fetched}, failed: {self.failed}, "
+            f"{self.bytes} bytes in {self.elapsed:.1f}s ({rate:.0f} bytes/sec)"
+        )
@@ -0,0 +1,232 @@
+"""Recompress localized pictures and make small cover thumbnails
+
+Pictures come from the archive at whatever size and quality they were
+uploaded with, metadata and all. Each one is recompressed to a target
+quality without its metadata (the original is kept when that would not
+make it smaller) and covers get a thumbnail next to them, X-t.jpg beside
+X.jpg, for the index pages.
+
+The results are cached by the hash of the original bytes, so a picture
+that was already done, here or in another output folder sharing the
+cache, is copied instead of being compressed again. imageopt.json keeps
+the hash of each original too, and when the settings or the covers change
+a picture is made again from its original, found in the archive or the
+cache, never from the optimized copy. A picture whose original is in
+neither is left as it is. Files are always replaced rather than written
+in place because localized pictures may be hard links into the archive.
+
+Pillow is optional and only imported to recompress; without it pictures
+are left as they are.
+"""
+
+from hashlib import sha1
+from importlib.util import find_spec
+from io import BytesIO
+from json import load as json_load, dump as json_dump
+from os import makedirs, replace
+import os.path as osp
+from shutil import copyfile
+from pools import make_pool
+
+
+def thumb_path(path):
+    """where the thumbnail of a picture goes"""
+    base, ext = osp.splitext(path)
+    return base + "-t" + ext
+
+
+def file_hash(path):
+    with open(path, "rb") as fp:
+        return sha1(fp.read()).hexdigest()
+
+
+def put(path, data):
+    """Replace path with data without touching the file it pointed to"""
+    with open(path + ".tmp", "wb") as fp:
+        fp.write(data)
+    replace(path + ".tmp", path)
+
+
+def save_jpeg(image, quality):
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    out = BytesIO()
+    image.save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+def recompress(data, quality, thumb_size):
+    """Return (smaller picture bytes, thumbnail bytes) for one original"""
+    from PIL import Image, ImageOps
+
+    with Image.open(BytesIO(data)) as image:
+        image.load()
+        # turn the pixels the way the orientation tag says before it is dropped
+        image = ImageOps.exif_transpose(image)
+        # saving without exif or icc drops the metadata
+        small = save_jpeg(image, quality)
+        if len(small) >= len(data):
+            small = data
+        image.thumbnail((thumb_size, thumb_size))
+        thumb = save_jpeg(image, quality)
+    return small, thumb
+
+
+def read_original(key, sources, cache):
+    """Return the bytes of the original with this hash or None when it is gone"""
+    candidates = list(sources)
+    if cache:
+        candidates.insert(0, osp.join(cache, key + ".jpg"))
+    for src in candidates:
+        if osp.isfile(src):
+            with open(src, "rb") as fp:
+                data = fp.read()
+            if sha1(data).hexdigest() == key:
+                return data
+    return None
+
+
+def _optimize(job):
+    """Optimize one picture in a worker, return (path, original hash, size before, size after)
+
+    key is the hash of the original, None when the picture at path is still
+    the original. The hash comes back None when the original is gone.
+    """
+    path, key, sources, want_thumb, quality, thumb_size, cache = job
+    data = None
+    if key is None:
+        with open(path, "rb") as fp:
+            data = fp.read()
+        key = sha1(data).hexdigest()
+    cached = cache and osp.join(cache, f"{key}-{quality}-{thumb_size}")
+    if cached and osp.exists(cached + ".jpg") and osp.exists(cached + "-t.jpg"):
+        before = len(data) if data is not None else osp.getsize(path)
+        copyfile(cached + ".jpg", path + ".tmp")
+        replace(path + ".tmp", path)
+        if want_thumb:
+            copyfile(cached + "-t.jpg", thumb_path(path) + ".tmp")
+            replace(thumb_path(path) + ".tmp", thumb_path(path))
+        return path, key, before, osp.getsize(path)
+    original = data is not None
+    if not original:
+        data = read_original(key, sources, cache)
+    if data is None:
+        # compressing the optimized picture again would only lose quality,
+        # a cover that needs a thumbnail gets one made from it though
+        if want_thumb and not osp.exists(thumb_path(path)):
+            with open(path, "rb") as fp:
+                data = fp.read()
+            try:
+                thumb = recompress(data, quality, thumb_size)[1]
+            except OSError:
+                thumb = data
+            put(thumb_path(path), thumb)
+        return path, None, 0, 0
+    if cache and not osp.exists(osp.join(cache, key + ".jpg")):
+        # keep the original for builds with other settings
+        put(osp.join(cache, key + ".jpg"), data)
+    try:
+        small, thumb = recompress(data, quality, thumb_size)
+    except OSError:
+        # not a picture Pillow can read, leave it and use it as its own thumbnail
+        small = thumb = data
+    # the file at path is an older optimized copy unless it is the original
+    if small is not data or not original:
+        put(path, small)
+    if want_thumb:
+        put(thumb_path(path), thumb)
+    if cached:
+        put(cached + ".jpg", small)
+        put(cached + "-t.jpg", thumb)
+    return path, key, len(data), len(small)
+
+
+class ImageOptimizer:
+    """Optimize the pictures in an output folder, skipping ones already done"""
+
+    def __init__(self, root, quality=80, thumb_size=200, cache="", workers=1,
+                 name="imageopt.json"):
+        self.quality = quality
+        self.thumb_size = thumb_size
+        self.cache = cache
+        self.workers = workers
+        self.path = osp.join(root, name)
+        # path to the hashes of the original and the optimized picture and the settings used
+        self.done = {}
+        if osp.exists(self.path):
+            with open(self.path, "rt", encoding="utf-8") as fp:
+                self.done = json_load(fp)
+        self.optimized = 0
+        self.skipped = 0
+        self.missing = 0
+        self.before = 0
+        self.after = 0
+
+    @property
+    def available(self):
+        return find_spec("PIL") is not None
+
+    def settings(self):
+        return f"{self.quality}-{self.thumb_size}"
+
+    def original(self, path):
+        """Hash of the original of the optimized picture at path, None if it is not one"""
+        entry = self.done.get(path)
+        if entry and osp.exists(path) and file_hash(path) == entry[1]:
+            return entry[0]
+        # not optimized yet, or replaced by a fresh copy of the original since
+        return None
+
+    def current(self, path, key, want_thumb):
+        """True if path is already the optimized picture for these settings"""
+        if key is None or self.done[path][2] != self.settings():
+            return False
+        return not want_thumb or osp.exists(thumb_path(path))
+
+    def run(self, paths, covers=(), sources=None):
+        """Optimize the pictures at paths, with thumbnails for the covers
+
+        sources maps a path to files that may hold its original, like the
+        archive copies it was localized from.
+        """
+        if not self.available:
+            print("Pillow is not installed, pictures are not optimized")
+            return
+        if self.cache:
+            makedirs(self.cache, exist_ok=True)
+        covers = set(covers)
+        sources = sources or {}
+        jobs = []
+        for path in dict.fromkeys(paths):
+            want_thumb = path in covers
+            key = self.original(path)
+            if self.current(path, key, want_thumb):
+                self.skipped += 1
+            else:
+                jobs.append((path, key, tuple(sources.get(path, ())), want_thumb,
+                             self.quality, self.thumb_size, self.cache))
+        if self.workers <= 1 or len(jobs) <= 1:
+            results = list(map(_optimize, jobs))
+        else:
+            with make_pool(self.workers) as pool:
+                results = pool.map(_optimize, jobs, 8)
+        for path, key, before, after in results:
+            if key is None:
+                self.missing += 1
+                continue
+            self.done[path] = [key, file_hash(path), self.settings()]
+            self.optimized += 1
+            self.before += before
+            self.after += after
+
+    def save(self):
+        """Remember what was done for the next build"""
+        with open(self.path + ".tmp", "wt", encoding="utf-8") as fp:
+            json_dump(self.done, fp)
+        replace(self.path + ".tmp", self.path)
+
+    def report(self):
+        print(
+            f"Images optimized: {self.optimized}, already done: {self.skipped}, "
+            f"original gone: {self.missing}, {self.before} bytes to {self.after} bytes"
+        )
@@ -0,0 +1,72 @@
+"""Remember where each picture was stored, in memory during a build
+
+Both tables of imagemap.sd are read into dicts when the build starts, and
+new entries are written back in batches and when the build exits. A build
+that dies between batches leaves a few pictures out of the map, and the
+next build fetches them again under the same numbers.
+"""
+
+import atexit
+
+
+class ImageRegistry:
+    """url to stored path and content hash to stored path"""
+
+    def __init__(self, path, batch=1000):
+        from sqlitedict import SqliteDict
+
+        self.path = path
+        self.batch = batch
+        with SqliteDict(path, flag="c") as urls:
+            self.urls = dict(urls.items())
+        with SqliteDict(path, tablename="hashes", flag="c") as hashes:
+            self.hashes = dict(hashes.items())
+        # distinct paths in the order they were first stored
+        self.paths = dict.fromkeys(self.urls.values())
+        self.pending_urls = {}
+        self.pending_hashes = {}
+        atexit.register(self.flush)
+
+    def __contains__(self, url):
+        return url in self.urls
+
+    def __getitem__(self, url):
+        return self.urls[url]
+
+    def __len__(self):
+        return len(self.urls)
+
+    def values(self):
+        return self.urls.values()
+
+    @property
+    def count(self):
+        """number of distinct pictures stored"""
+        return len(self.paths)
+
+    def find(self, key):
+        """stored path of the picture with this content hash or None"""
+        return self.hashes.get(key)
+
+    def add(self, url, path, key=None):
+        """Record that url is stored at path, flushing every batch entries"""
+        self.urls[url] = path
+        self.pending_urls[url] = path
+        self.paths.setdefault(path, None)
+        if key is not None and key not in self.hashes:
+            self.hashes[key] = path
+            self.pending_hashes[key] = path
+        if len(self.pending_urls) >= self.batch:
+            self.flush()
+
+    def flush(self):
+        """Write the entries added since the last flush in one transaction each"""
+        from sqlitedict import SqliteDict
+
+        for tablename, pending in (("unnamed", self.pending_urls), ("hashes", self.pending_hashes)):
+            if not pending:
+                continue
+            with SqliteDict(self.path, tablename=tablename) as table:
+                table.update(pending)
+                table.commit()
+            pending.clear()
@@ -0,0 +1,78 @@
+"""Remember what went into every generated file
+
+The manifest maps each output (relative to the output folder) to a hash of
+the inputs that produced it. A later build rewrites only the outputs whose
+inputs changed and deletes the ones it no longer produces.
+"""
+
+from hashlib import sha1
+from json import dumps as json_dumps, load as json_load, dump as json_dump
+from os import makedirs, remove, replace
+import os.path as osp
+
+
+def digest(*parts):
+    """Hash any values json can represent or a single bytes value"""
+    if len(parts) == 1 and isinstance(parts[0], bytes):
+        return sha1(parts[0]).hexdigest()
+    text = json_dumps(parts, sort_keys=True, default=str)
+    return sha1(text.encode("utf-8")).hexdigest()
+
+
+class BuildManifest:
+    """Track the inputs of each output across builds"""
+
+    def __init__(self, root, name="build-manifest.json", incremental=True):
+        self.root = root
+        self.path = osp.join(root, name)
+        self.incremental = incremental
+        self.old = {}
+        if osp.exists(self.path):
+            with open(self.path, "rt", encoding="utf-8") as fp:
+                self.old = json_load(fp)
+        self.new = {}
+        self.written = 0
+        self.unchanged = 0
+
+    def stale(self, path, key):
+        """Claim path for this build, True if it has to be written"""
+        rel = osp.relpath(path, self.root)
+        self.new[rel] = key
+        if self.incremental and self.old.get(rel) == key and osp.exists(path):
+            self.unchanged += 1
+            return False
+        self.written += 1
+        return True
+
+    def write(self, path, key, content):
+        """Write content, a string or a function making one, if it is stale
+
+        bytes content is written as it is.
+        """
+        if not self.stale(path, key):
+            return False
+        if callable(content):
+            content = content()
+        makedirs(osp.dirname(path), exist_ok=True)
+        if isinstance(content, bytes):
+            with open(path, "wb") as fp:
+                fp.write(content)
+        else:
+            with open(path, "wt", encoding="utf-8") as fp:
+                fp.write(content)
+        return True
+
+    def save(self):
+        """Delete outputs this build did not produce and record the rest"""
+        orphans = [rel for rel in self.old if rel not in self.new]
+        for rel in orphans:
+            path = osp.join(self.root, rel)
+            if osp.exists(path):
+                remove(path)
+        with open(self.path + ".tmp", "wt", encoding="utf-8") as fp:
+            json_dump(self.new, fp)
+        replace(self.path + ".tmp", self.path)
+        print(
+            f"Outputs written: {self.written}, unchanged: {self.unchanged}, "
+            f"removed: {len(orphans)}"
+        )
@@ -0,0 +1,68 @@
+"""Find the NLTK data we need without asking the network every build
+
+nltk.download checks the server even when the data is already installed,
+which costs a round trip on every run and fails on machines without a
+network. Here each resource is looked for first in a local folder we own
+(data/nltk_data unless NLTK_DATA_DIR says otherwise), then wherever NLTK
+normally looks, and it is only downloaded, into the local folder, when it
+is in neither. nltk itself is only imported when the local folder does
+not have what we want.
+
+Fill the local folder ahead of time for a build host without a network:
+python3 nltkdata.py
+"""
+
+import os
+import os.path as osp
+
+LOCAL = os.environ.get(
+    "NLTK_DATA_DIR", osp.join(osp.dirname(osp.abspath(__file__)), "data", "nltk_data"))
+
+# package name for nltk.download and the path nltk.data.find looks for
+RESOURCES = {
+    "stopwords": "corpora/stopwords",
+    "punkt": "tokenizers/punkt",
+    "averaged_perceptron_tagger": "taggers/averaged_perceptron_tagger",
+}
+
+
+def use_local():
+    """Make nltk look in our folder first"""
+    import nltk
+
+    if LOCAL not in nltk.data.path:
+        nltk.data.path.insert(0, LOCAL)
+    return nltk
+
+
+def ensure(*names):
+    """Make sure the named resources can be loaded, downloading as a last resort"""
+    for name in names:
+        if osp.exists(osp.join(LOCAL, RESOURCES[name])):
+            use_local()
+            continue
+        nltk = use_local()
+        try:
+            nltk.data.find(RESOURCES[name])
+        except LookupError:
+            os.makedirs(LOCAL, exist_ok=True)
+            nltk.download(name, download_dir=LOCAL, quiet=True)
+
+
+def stop_words(language="english"):
+    """The NLTK stop words, read straight from the file when we have it"""
+    path = osp.join(LOCAL, RESOURCES["stopwords"], language)
+    if not osp.exists(path):
+        ensure("stopwords")
+        from nltk.corpus import stopwords
+
+        return set(stopwords.words(language))
+    with open(path, "rt", encoding="utf-8") as fp:
+        return set(fp.read().split())
+
+
+if __name__ == "__main__":
+    nltk = use_local()
+    os.makedirs(LOCAL, exist_ok=True)
+    for name in RESOURCES:
+        nltk.download(name, download_dir=LOCAL)
@@ -0,0 +1,13 @@
+"""Process pools for the build stages that can run in parallel"""
+
+from multiprocessing import get_all_start_methods, get_context
+
+
+def make_pool(workers, initializer=None, initargs=()):
+    """Start a pool of worker processes
+
+    generate.py runs at module level, so we prefer fork where it exists;
+    spawn would re-run the whole script in every worker.
+    """
+    method = "fork" if "fork" in get_all_start_methods() else None
+    return get_context(method).Pool(workers, initializer, initargs)
@@ -0,0 +1,130 @@
+"""Write .gz and .br copies of the text files in a generated site
+
+Static servers (nginx gzip_static/brotli_static, Caddy precompressed, ...)
+can then send the compressed bytes without compressing on every request.
+A compressed copy gets the modification time of its source, so a copy whose
+time still matches is current and is left alone. Copies whose source is
+gone or too small now are removed.
+
+Run it on its own after copying the pages into the site:
+python3 precompress.py out=/var/www/static/tiny
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+from os import remove, replace, stat, utime, walk
+import os.path as osp
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+# compressing these again gains nothing
+SKIP = {".gz", ".br", ".jpg", ".jpeg", ".png", ".gif", ".webp", ".bin", ".sd", ".zip", ".prof"}
+# build bookkeeping that is never served
+PRIVATE = {"build-manifest.json", "idregistry.json", "build-stats.json", "imageopt.json"}
+
+
+def gzip_bytes(data):
+    """gzip with no timestamp so equal inputs give equal outputs"""
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def brotli_bytes(data):
+    return brotli.compress(data, quality=11)
+
+
+class Precompressor:
+    """Keep .gz and .br siblings of the text files under root current"""
+
+    def __init__(self, root, minimum=1024, workers=4, use_brotli=True):
+        self.root = root
+        self.minimum = minimum
+        self.workers = max(1, workers)
+        self.encoders = [(".gz", gzip_bytes)]
+        if use_brotli and brotli is not None:
+            self.encoders.append((".br", brotli_bytes))
+        self.written = 0
+        self.current = 0
+        self.removed = 0
+        self.original = 0
+        self.compressed = {ext: 0 for ext, _ in self.encoders}
+
+    def wanted(self, path):
+        """True if path is a text file worth compressing"""
+        name = osp.basename(path)
+        ext = osp.splitext(name)[1].lower()
+        if ext in SKIP or name in PRIVATE or name.startswith("."):
+            return False
+        return osp.getsize(path) >= self.minimum
+
+    def compress(self, path):
+        """Write the siblings of one file, return (size, {ext: size}, written)"""
+        info = stat(path)
+        sizes = {}
+        data = None
+        written = 0
+        for ext, encode in self.encoders:
+            target = path + ext
+            if osp.exists(target) and stat(target).st_mtime_ns == info.st_mtime_ns:
+                sizes[ext] = osp.getsize(target)
+                continue
+            if data is None:
+                with open(path, "rb") as fp:
+                    data = fp.read()
+            packed = encode(data)
+            with open(target + ".tmp", "wb") as fp:
+                fp.write(packed)
+            utime(target + ".tmp", ns=(info.st_atime_ns, info.st_mtime_ns))
+            replace(target + ".tmp", target)
+            sizes[ext] = len(packed)
+            written += 1
+        return info.st_size, sizes, written
+
+    def run(self):
+        """Compress everything under root and remove stale siblings"""
+        sources = []
+        for folder, _, names in walk(self.root):
+            for name in names:
+                path = osp.join(folder, name)
+                base, ext = osp.splitext(path)
+                if ext in (".gz", ".br"):
+                    # a sibling whose source went away or no longer qualifies
+                    if not osp.isfile(base) or not self.wanted(base):
+                        remove(path)
+                        self.removed += 1
+                elif self.wanted(path):
+                    sources.append(path)
+        with ThreadPoolExecutor(self.workers) as pool:
+            for size, sizes, written in pool.map(self.compress, sources):
+                self.original += size
+                for ext, packed in sizes.items():
+                    self.compressed[ext] += packed
+                self.written += written
+                self.current += len(sizes) - written
+        return self
+
+    def report(self):
+        """Print the totals for this run"""
+        saved = ", ".join(
+            f"{ext} saves {self.original - packed} bytes"
+            for ext, packed in self.compressed.items()
+        )
+        print(
+            f"Precompressed {self.original} bytes in files, "
+            f"written: {self.written}, current: {self.current}, "
+            f"removed: {self.removed}; {saved}"
+        )
+
+
+if __name__ == "__main__":
+    import myArgs
+
+    args = myArgs.Parse(
+        out="dist",  # the folder to precompress
+        precompressMin=1024,  # smallest file in bytes worth compressing
+        brotli=True,  # also write .br files when the brotli module is installed
+        workers=4,  # number of files to compress at once
+    )
+    Precompressor(args.out, args.precompressMin, args.workers, args.brotli).run().report()
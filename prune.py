@@ -0,0 +1,75 @@
+"""Prune the (word, slug) index down to useful words and books
+
+Words that occur in too few books are dropped, then books left with too few
+or too many words are dropped, and that repeats until nothing changes.
+Rather than recounting everything on each pass we keep the degree of every
+word and book and only look again at the ones whose degree just went down,
+which reaches the same fixed point in close to linear time.
+"""
+
+
+def prune_index(pairs, minAppearances, minWordsPerBook, maxWordsPerBook):
+    """Return (word to slugs map sorted by word, set of slugs kept, stats)"""
+    word_slugs = {}
+    slug_words = {}
+    for word, slug in pairs:
+        word_slugs.setdefault(word, []).append(slug)
+        slug_words.setdefault(slug, []).append(word)
+    word_degree = {word: len(slugs) for word, slugs in word_slugs.items()}
+    slug_degree = {slug: len(words) for slug, words in slug_words.items()}
+
+    dead_words = set()
+    dead_slugs = set()
+    stats = dict(passes=0, rare_words=0, short_books=0, long_books=0)
+
+    # everything is looked at on the first pass
+    words_to_check = list(word_slugs)
+    slugs_to_check = None
+    while True:
+        stats["passes"] += 1
+
+        # drop the words that only occur a few times
+        changed_slugs = {}
+        for word in words_to_check:
+            if word in dead_words or word_degree[word] > minAppearances:
+                continue
+            dead_words.add(word)
+            stats["rare_words"] += 1
+            for slug in word_slugs[word]:
+                if slug not in dead_slugs:
+                    slug_degree[slug] -= 1
+                    changed_slugs[slug] = True
+        if slugs_to_check is None:
+            slugs_to_check = list(slug_words)
+        else:
+            slugs_to_check = list(changed_slugs)
+
+        # drop the books that have too few or too many words
+        changed_words = {}
+        for slug in slugs_to_check:
+            degree = slug_degree[slug]
+            if slug in dead_slugs or minWordsPerBook <= degree < maxWordsPerBook:
+                continue
+            dead_slugs.add(slug)
+            if degree < minWordsPerBook:
+                stats["short_books"] += 1
+            else:
+                stats["long_books"] += 1
+            for word in slug_words[slug]:
+                if word not in dead_words:
+                    word_degree[word] -= 1
+                    changed_words[word] = True
+
+        if not changed_words:
+            break
+        words_to_check = list(changed_words)
+
+    wordToSlugs = {}
+    for word in sorted(word_slugs):
+        if word in dead_words:
+            continue
+        slugs = [slug for slug in word_slugs[word] if slug not in dead_slugs]
+        if slugs:
+            wordToSlugs[word] = slugs
+    kept = {slug for slugs in wordToSlugs.values() for slug in slugs}
+    return wordToSlugs, kept, stats
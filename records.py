@@ -0,0 +1,37 @@
+"""Compact records for the books that make it into the site
+
+A record keeps the few fields the build needs after pruning in slots, the
+page texts and picture urls in two tuples, and lets go of the texts once
+the pages are rendered.
+"""
+
+
+class BookRecord:
+    """What the build keeps of one selected book"""
+
+    __slots__ = (
+        "slug", "title", "author", "audience", "reviewed",
+        "rating_total", "rating_count", "texts", "urls",
+        # filled in while writing the book
+        "id", "link", "image",
+    )
+
+    def __init__(self, book):
+        self.slug = book["slug"]
+        self.title = book["title"]
+        self.author = book["author"]
+        self.audience = book["audience"]
+        self.reviewed = book["reviewed"]
+        self.rating_total = book["rating_total"]
+        self.rating_count = book["rating_count"]
+        self.texts = tuple(page["text"] for page in book["pages"])
+        self.urls = tuple(page["url"] for page in book["pages"])
+        self.id = self.link = self.image = None
+
+    @property
+    def average_rating(self):
+        return self.rating_total / self.rating_count if self.rating_count > 0 else 0
+
+    def drop_texts(self):
+        """Forget the page texts once nothing needs them"""
+        self.texts = None
@@ -0,0 +1,85 @@
+"""Render and write pages in parallel
+
+The parent builds every view and decides what needs writing; the workers
+only run the template and write the file, so the pages are the same bytes
+no matter how many workers render them.
+"""
+
+from os import makedirs
+import os.path as osp
+from pools import make_pool
+from templates import registry
+
+
+def render(template, view):
+    """Render the template file with the view"""
+    return registry.render(template, **view)
+
+
+def _init(module_directory):
+    registry.module_directory = module_directory
+
+
+def _write(job):
+    """Render one page and write it"""
+    template, view, path = job
+    html = render(template, view)
+    makedirs(osp.dirname(path), exist_ok=True)
+    with open(path, "wt", encoding="utf-8") as fp:
+        fp.write(html)
+    return path
+
+
+class PageWriter:
+    """Write pages as they are added, with a pool of workers when there are several
+
+    Serially a page is written as soon as it is added. With workers the pages
+    go to the pool in batches; a batch is handed over while the previous one
+    is still rendering, so the parent holds at most two batches of views.
+    """
+
+    def __init__(self, workers=1, chunksize=8, batch=256):
+        self.workers = workers
+        self.chunksize = chunksize
+        self.batch = batch
+        self.jobs = []
+        self.pool = None
+        self.pending = None
+        self.written = 0
+
+    def add(self, template, view, path):
+        """Write a page rendered from the template file, or queue it for the pool"""
+        if self.workers <= 1:
+            _write((template, view, path))
+            self.written += 1
+            return
+        self.jobs.append((template, view, path))
+        if len(self.jobs) >= self.batch:
+            self.flush()
+
+    def wait(self):
+        """Wait for the batch the pool is working on"""
+        if self.pending is not None:
+            self.written += sum(1 for _ in self.pending)
+            self.pending = None
+
+    def flush(self):
+        """Hand the queued pages to the pool once it is done with the last batch"""
+        jobs, self.jobs = self.jobs, []
+        self.wait()
+        if not jobs:
+            return
+        if self.pool is None:
+            self.pool = make_pool(self.workers, _init, (registry.module_directory,))
+        self.pending = self.pool.imap_unordered(_write, jobs, self.chunksize)
+
+    def run(self):
+        """Write every page still queued, return how many were written since the last run"""
+        self.flush()
+        self.wait()
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        written, self.written = self.written, 0
+        return written
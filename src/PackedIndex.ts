@@ -0,0 +1,118 @@
+/* Read the packed word index written by generate.py indexFormat=packed
+ *
+ * table.json maps each term to [shard, offset, length, kind]. The posting
+ * list for a term is fetched with a range request, or sliced out of the
+ * whole shard when the server ignores ranges.
+ */
+
+export const DELTA = 0;
+export const BITSET = 1;
+
+type Entry = [number, number, number, number];
+
+interface Table {
+  shards: number;
+  terms: { [term: string]: Entry };
+}
+
+// decode a posting list into sorted book numbers
+export const decodePostings = (bytes: Uint8Array, kind: number): number[] => {
+  let i = 0;
+  const varint = (): number => {
+    let value = 0;
+    let scale = 1;
+    let byte: number;
+    do {
+      byte = bytes[i++];
+      value += (byte & 0x7f) * scale;
+      scale *= 128;
+    } while (byte & 0x80);
+    return value;
+  };
+  const numbers: number[] = [];
+  if (kind == DELTA) {
+    let previous = 0;
+    while (i < bytes.length) {
+      previous += varint();
+      numbers.push(previous);
+    }
+  } else if (kind == BITSET) {
+    const first = varint();
+    for (let j = i; j < bytes.length; j++) {
+      for (let bit = 0; bit < 8; bit++) {
+        if (bytes[j] & (1 << bit)) {
+          numbers.push(first + (j - i) * 8 + bit);
+        }
+      }
+    }
+  }
+  return numbers;
+};
+
+// fetch that treats an error status as a failure
+const fetchOk = async (url: string): Promise<Response> => {
+  const resp = await fetch(url);
+  if (!resp.ok) {
+    throw new Error(`Fetching ${url} failed with status ${resp.status}`);
+  }
+  return resp;
+};
+
+export class PackedIndex {
+  private prefix: string;
+  private table: Promise<Table> = null;
+  // shards we had to fetch whole
+  private shards = new Map<number, Promise<ArrayBuffer>>();
+
+  public constructor(prefix: string) {
+    this.prefix = prefix;
+  }
+
+  private getTable = (): Promise<Table> => {
+    if (!this.table) {
+      this.table = fetchOk(this.prefix + "table.json").then(resp => resp.json());
+      // let a later lookup try again
+      this.table.catch(() => (this.table = null));
+    }
+    return this.table;
+  };
+
+  private getBytes = async (shard: number, offset: number, length: number): Promise<Uint8Array> => {
+    const url = `${this.prefix}shard${shard}.bin`;
+    if (!this.shards.has(shard)) {
+      let resp: Response;
+      try {
+        resp = await fetch(url, {
+          headers: { Range: `bytes=${offset}-${offset + length - 1}` }
+        });
+      } catch (e) {
+        // offline, the whole shard may still be in the cache
+        resp = await fetch(url);
+      }
+      if (!resp.ok) {
+        throw new Error(`Fetching ${url} failed with status ${resp.status}`);
+      }
+      if (resp.status == 206) {
+        return new Uint8Array(await resp.arrayBuffer());
+      }
+      // the server sent it all so keep it for the next term
+      this.shards.set(shard, resp.arrayBuffer());
+    }
+    return new Uint8Array(await this.shards.get(shard), offset, length);
+  };
+
+  // book numbers for a term or null if the term is not in the index
+  public lookup = async (term: string): Promise<number[] | null> => {
+    const table = await this.getTable();
+    if (!table.terms.hasOwnProperty(term)) {
+      return null;
+    }
+    const [shard, offset, length, kind] = table.terms[term];
+    if (length == 0) {
+      return [];
+    }
+    return decodePostings(await this.getBytes(shard, offset, length), kind);
+  };
+}
+
+export default PackedIndex;
@@ -17,6 +17,7 @@ interface Config {
   lastReviewed: string; // id of last reviewed book
   first: string; // id of first book
   last: string; // id of last book
+  index?: string; // "packed" when the word index is in shards
 }
 
 // load this down below in init
@@ -33,9 +34,14 @@ import { registerServiceWorker } from "./start-sw.js";
 
 import {
   BookSet,
-  BookSetModel
+  BookSetModel,
+  EncoderDecoder
 } from "./BookSet.js";
 
+import PackedIndex from "./PackedIndex.js";
+
+const packedIndex = new PackedIndex("content/index/");
+
 import speak from "./speech.js";
 
 import { openDB, DBSchema } from "./web_modules/idb.js";
@@ -66,11 +72,24 @@ function getQueryTerms(): string[] {
   }
 }
 
-async function getIndexForTerm(term: string): Promise<BookSet | null> {
+// get the ids for a term as a string or null if it isn't in the index
+async function fetchTerm(term: string): Promise<string | null> {
+  if (config.index == "packed") {
+    const numbers = await packedIndex.lookup(term);
+    if (numbers) {
+      const encoder = new EncoderDecoder(config.digits, config.base);
+      return numbers.map(encoder.encode).join('');
+    }
+    // AllAvailable is still a file of its own
+  }
   const resp = await fetch("content/index/" + term);
+  return resp.ok ? await resp.text() : null;
+}
+
+async function getIndexForTerm(term: string): Promise<BookSet | null> {
+  const text = await fetchTerm(term);
 
-  if (resp.ok) { // i.e. if the term exists in our index
-    const text = await resp.text();
+  if (text != null) { // i.e. if the term exists in our index
     return new BookSetModel(text, config.digits, config.base);
   }
 
@@ -82,8 +101,7 @@ async function getIndexForTerm(term: string): Promise<BookSet | null> {
     const substrings: string[] = words.filter(word => word.indexOf(term) >= 0);
     let result: BookSet = null;
     for (let str of substrings) {
-      const respTerm = await fetch('content/index/' + str);
-      const books = await respTerm.text();
+      const books = await fetchTerm(str);
       const currBook = new BookSetModel(books, config.digits, config.base);
       if (result == null) {
         result = currBook;
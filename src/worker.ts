@@ -6,6 +6,7 @@ declare const workbox: any;
 
 workbox.loadModule("workbox-strategies");
 workbox.loadModule("workbox-precaching");
+workbox.loadModule("workbox-range-requests");
 
 // route for fetching images
 workbox.routing.registerRoute(
@@ -46,6 +47,29 @@ workbox.routing.registerRoute(/.\/content\/index\/ALLWORDS$/, async () => {
   return new Response(await words);
 })
 
+// shards of the packed index are asked for a range at a time, and a 206 is
+// not cached, so keep the whole shard and cut the range out of it; that way
+// searches keep working offline
+const shardStrategy = new workbox.strategies.NetworkFirst({
+  cacheName: "index-cache",
+  plugins: [
+    new workbox.expiration.Plugin({
+      maxAgeSeconds: 30 * 24 * 60 * 60 // 30 days
+    })
+  ]
+});
+
+workbox.routing.registerRoute(
+  /.\/content\/index\/shard\d+\.bin$/,
+  async ({ event }: { event: any }) => {
+    const whole = await shardStrategy.makeRequest({
+      event,
+      request: event.request.url
+    });
+    return workbox.rangeRequests.createPartialResponse(event.request, whole);
+  }
+);
+
 workbox.routing.registerRoute(
   /.\/content\/index/,
   new workbox.strategies.NetworkFirst({
@@ -122,6 +146,10 @@ async function getWords(): Promise<string> {
   keys.forEach((request, index, array) => {
     const url = request.url;
     const word = url.split('/').slice(-1)[0];
+    // the shards and table of the packed index are not words
+    if (word.match(/\.(?:bin|json)$/)) {
+      return;
+    }
     words += word + ' ';
   });
 
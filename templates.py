@@ -0,0 +1,46 @@
+"""Compile each template once per process
+
+Templates are found by file name. A compiled template is reused until its
+source file changes, and with a module directory the generated Python
+modules are kept on disk so later builds and watch mode skip compiling too.
+"""
+
+from os import stat
+from mako.template import Template
+from mako import exceptions
+
+
+class TemplateRegistry:
+    """Cache of compiled templates keyed by file name"""
+
+    def __init__(self, module_directory=None):
+        self.module_directory = module_directory
+        self.templates = {}
+
+    def get(self, filename):
+        """Return the compiled template, recompiling if the file changed"""
+        mtime = stat(filename).st_mtime_ns
+        cached = self.templates.get(filename)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        template = Template(
+            filename=filename,
+            module_directory=self.module_directory or None,
+            input_encoding="utf-8",
+            # match reading the source in text mode
+            preprocessor=lambda text: text.replace("\r\n", "\n"),
+        )
+        self.templates[filename] = (mtime, template)
+        return template
+
+    def render(self, filename, **kwargs):
+        """Render a template with traceback"""
+        try:
+            return self.get(filename).render(**kwargs)
+        except Exception:
+            print(exceptions.text_error_template().render())
+            raise
+
+
+# shared by everything that renders in this process
+registry = TemplateRegistry()
@@ -0,0 +1,81 @@
+import { decodePostings, DELTA, BITSET, PackedIndex } from "../src/PackedIndex";
+
+// written by wordindex.encode_postings in generate's packed index
+test('Decoding delta encoded postings', () => {
+  const bytes = new Uint8Array([0x03, 0xc5, 0x01, 0xa0, 0x06]);
+  expect(decodePostings(bytes, DELTA)).toEqual([3, 200, 1000]);
+});
+
+test('Decoding bitset encoded postings', () => {
+  const bytes = new Uint8Array([0x01, 0xff, 0x03]);
+  expect(decodePostings(bytes, BITSET)).toEqual([1, 2, 3, 4, 5, 6, 7, 8, 9, 10]);
+});
+
+test('Decoding an empty posting list', () => {
+  expect(decodePostings(new Uint8Array([]), DELTA)).toEqual([]);
+});
+
+test('Delta and bitset agree on random postings', () => {
+  const varint = (value: number, out: number[]) => {
+    while (value >= 0x80) {
+      out.push((value & 0x7f) | 0x80);
+      value = Math.floor(value / 128);
+    }
+    out.push(value);
+  };
+  for (let t = 0; t < 20; t++) {
+    const numbers = [...new Set([...Array(50)].map(() => Math.floor(Math.random() * 4000)))].sort((a, b) => a - b);
+    const delta: number[] = [];
+    let previous = 0;
+    for (const n of numbers) {
+      varint(n - previous, delta);
+      previous = n;
+    }
+    const bitset: number[] = [];
+    varint(numbers[0], bitset);
+    const bits = new Array(((numbers[numbers.length - 1] - numbers[0]) >> 3) + 1).fill(0);
+    for (const n of numbers) {
+      const offset = n - numbers[0];
+      bits[offset >> 3] |= 1 << (offset & 7);
+    }
+    expect(decodePostings(new Uint8Array(delta), DELTA)).toEqual(numbers);
+    expect(decodePostings(new Uint8Array(bitset.concat(bits)), BITSET)).toEqual(numbers);
+  }
+});
+
+// a server with one shard holding dog (3, 5) and cat (5)
+const table = { shards: 1, terms: { dog: [0, 1, 2, DELTA], cat: [0, 0, 1, DELTA] } };
+const shard = new Uint8Array([0x05, 0x03, 0x02]);
+const server = (status: number, ranges: boolean) => async (url: string, init?: any) => {
+  if (url.endsWith("table.json")) {
+    return { ok: true, status: 200, json: async () => table };
+  }
+  if (status != 200) {
+    return { ok: false, status, arrayBuffer: async () => new ArrayBuffer(9) };
+  }
+  if (ranges && init) {
+    const [first, last] = init.headers.Range.slice(6).split("-").map(Number);
+    return { ok: true, status: 206, arrayBuffer: async () => shard.slice(first, last + 1).buffer };
+  }
+  return { ok: true, status: 200, arrayBuffer: async () => shard.slice().buffer };
+};
+
+test('Looking up terms with range requests', async () => {
+  (global as any).fetch = server(200, true);
+  const index = new PackedIndex("index/");
+  expect(await index.lookup("dog")).toEqual([3, 5]);
+  expect(await index.lookup("cat")).toEqual([5]);
+  expect(await index.lookup("bird")).toBeNull();
+});
+
+test('Looking up terms when the server sends whole shards', async () => {
+  (global as any).fetch = server(200, false);
+  const index = new PackedIndex("index/");
+  expect(await index.lookup("dog")).toEqual([3, 5]);
+  expect(await index.lookup("cat")).toEqual([5]);
+});
+
+test('A missing shard is an error rather than postings', async () => {
+  (global as any).fetch = server(404, true);
+  await expect(new PackedIndex("index/").lookup("dog")).rejects.toThrow("404");
+});
@@ -0,0 +1,177 @@
+"""The fetch scripts against a local stand in for the THR server"""
+
+from gzip import open as gzip_open
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os.path as osp
+import sys
+import threading
+from urllib.parse import urlsplit, parse_qs
+
+import pytest
+from requests.exceptions import HTTPError
+
+ROOT = osp.dirname(osp.dirname(osp.abspath(__file__)))
+sys.path.insert(0, osp.join(ROOT, "data"))
+
+from fetchBooks import fetch_books
+import fetchCollections
+
+PAGE_SIZE = 3
+
+
+class Site:
+    """What the stub serves, changed by the tests as they go"""
+
+    def __init__(self):
+        self.books = []
+        self.collections = []
+        self.fail = set()
+        self.requested = []
+
+    def add_books(self, n):
+        for _ in range(n):
+            i = len(self.books)
+            self.books.append(dict(ID=i, slug=f"b{i}", author="DLM", pages=[]))
+
+    def find(self, page):
+        listed = self.books[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]
+        return dict(books=[dict(slug=b["slug"], author=b["author"]) for b in listed],
+                    more=page * PAGE_SIZE < len(self.books))
+
+    def add_collections(self, n):
+        for _ in range(n):
+            j = len(self.collections)
+            members = [f"b{i}" for i in range(j, j + 3)]
+            self.collections.append((dict(slug=f"c{j}", title=f"Collection {j}"), members))
+
+    def collection_page(self, page):
+        listed = self.collections[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]
+        return dict(collections=[dict(c) for c, _ in listed], has_collections=bool(listed))
+
+    def favorites(self, slug):
+        members = next(members for c, members in self.collections if c["slug"] == slug)
+        return dict(books=[dict(slug=member) for member in members])
+
+
+def make_handler(site):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+            site.requested.append((parts.path, query))
+            if (parts.path, query.get("page", query.get("slug", query.get("cpage")))) in site.fail:
+                self.send_error(404)
+                return
+            if parts.path == "/find/":
+                body = site.find(int(query["page"]))
+            elif parts.path == "/book-as-json/":
+                body = next(b for b in site.books if b["slug"] == query["slug"])
+            elif parts.path == "/collections":
+                body = site.collection_page(int(query["cpage"]))
+            elif parts.path == "/favorites/":
+                body = site.favorites(query["collection"])
+            else:
+                self.send_error(404)
+                return
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+@pytest.fixture
+def site():
+    site = Site()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(site))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    site.host = f"http://127.0.0.1:{server.server_port}"
+    yield site
+    server.shutdown()
+    server.server_close()
+
+
+def crawl(site, db, **kw):
+    books = fetch_books(host=site.host, db=str(db), stop=100, workers=2, retries=0, **kw)
+    slugs = set(books.keys())
+    books.close()
+    return slugs
+
+
+def find_pages(site):
+    pages = [int(query["page"]) for path, query in site.requested if path == "/find/"]
+    site.requested.clear()
+    return pages
+
+
+def test_refresh_walks_every_page_again(site, tmp_path):
+    db = tmp_path / "books.sqlite"
+    site.add_books(7)
+    assert crawl(site, db) == {f"b{i}" for i in range(7)}
+    site.add_books(5)
+    find_pages(site)
+    assert crawl(site, db) == {f"b{i}" for i in range(12)}
+    assert find_pages(site) == [1, 2, 3, 4]
+
+
+def test_interrupted_crawl_resumes(site, tmp_path):
+    db = tmp_path / "books.sqlite"
+    site.add_books(12)
+    site.fail.add(("/book-as-json/", "b7"))
+    with pytest.raises(HTTPError):
+        crawl(site, db)
+    site.fail.clear()
+    find_pages(site)
+    # the first two pages are stored, the third was cut short
+    assert crawl(site, db) == {f"b{i}" for i in range(12)}
+    assert find_pages(site) == [3, 4]
+
+
+def test_start_overrides_the_saved_page(site, tmp_path):
+    db = tmp_path / "books.sqlite"
+    site.add_books(12)
+    site.fail.add(("/find/", "3"))
+    with pytest.raises(HTTPError):
+        crawl(site, db)
+    site.fail.clear()
+    find_pages(site)
+    crawl(site, db, start=2)
+    assert find_pages(site) == [2, 3, 4]
+
+
+def test_collections_come_out_in_page_order(site, tmp_path):
+    out = tmp_path / "collections.json.gz"
+    # several windows of two pages, the last one partly empty
+    site.add_collections(14)
+    fetchCollections.main(host=site.host, favorites=site.host, out=str(out),
+                          workers=2, retries=0)
+    with gzip_open(out, "rt", encoding="utf-8") as fp:
+        collections = json.load(fp)
+    assert list(collections) == [f"c{j}" for j in range(14)]
+    assert collections["c5"] == dict(slug="c5", title="Collection 5", book_slugs=["b5", "b6", "b7"])
+    # the first window is written before the next pages are asked for
+    paths = [(path, query.get("cpage")) for path, query in site.requested]
+    assert paths.index(("/favorites/", None)) < paths.index(("/collections", "3"))
+
+
+def test_failed_collections_crawl_keeps_the_old_file(site, tmp_path):
+    out = tmp_path / "collections.json.gz"
+    site.add_collections(14)
+    fetchCollections.main(host=site.host, favorites=site.host, out=str(out),
+                          workers=2, retries=0)
+    good = out.read_bytes()
+    # the second window fails after the first one was written
+    site.add_collections(3)
+    site.fail.add(("/collections", "3"))
+    with pytest.raises(HTTPError):
+        fetchCollections.main(host=site.host, favorites=site.host, out=str(out),
+                              workers=2, retries=0)
+    assert out.read_bytes() == good
@@ -0,0 +1,82 @@
+"""Builds of a small synthetic corpus with generate.py"""
+
+import json
+import os
+import os.path as osp
+import re
+import subprocess
+import sys
+
+import pytest
+
+ROOT = osp.dirname(osp.dirname(osp.abspath(__file__)))
+sys.path.insert(0, osp.join(ROOT, "bench"))
+
+from synth import make_corpus
+
+STOP_WORDS = "the a and to is i you it in of was on for at with he she we they"
+
+
+@pytest.fixture(scope="module")
+def corpus(tmp_path_factory):
+    folder = tmp_path_factory.mktemp("corpus")
+    make_corpus(str(folder), 300, seed=3, pictures=200)
+    # stop words where nltkdata looks first so the build needs no network
+    stopwords = folder / "nltk_data" / "corpora" / "stopwords"
+    stopwords.mkdir(parents=True)
+    (stopwords / "english").write_text("\n".join(STOP_WORDS.split()))
+    return folder
+
+
+def generate(corpus, out, *argv):
+    env = dict(os.environ, NLTK_DATA_DIR=str(corpus / "nltk_data"))
+    # CopyPage writes the stylesheets into dist/ under the working folder,
+    # so run from a scratch folder that sees our templates
+    work = corpus / "work"
+    if not work.exists():
+        work.mkdir()
+        (work / "src").symlink_to(osp.join(ROOT, "src"))
+    subprocess.run(
+        [sys.executable, osp.join(ROOT, "generate.py"), f"out={out}",
+         f"books={corpus / 'books.json.gz'}",
+         f"collections={corpus / 'collections.json.gz'}",
+         f"images={corpus / 'archive'}",
+         "minAppearances=1", "minWordsPerBook=3", *argv],
+        cwd=work, env=env, check=True, stdout=subprocess.DEVNULL)
+
+
+def index_pages(out):
+    """{index.html path: [book IDs it lists]}"""
+    pages = {}
+    for folder, _, names in os.walk(osp.join(out, "content")):
+        if "index.html" in names and folder != osp.join(out, "content"):
+            with open(osp.join(folder, "index.html"), encoding="utf-8") as fp:
+                pages[osp.join(folder, "index.html")] = re.findall(r'<li id="(\w+)"', fp.read())
+    return pages
+
+
+def test_stable_ids_with_a_smaller_earlier_build(corpus, tmp_path):
+    out = tmp_path / "site"
+    generate(corpus, out, "stableIds", "query=dog")
+    generate(corpus, out, "stableIds")
+
+    with open(out / "content" / "config.json", encoding="utf-8") as fp:
+        digits = json.load(fp)["digits"]
+    with open(out / "content" / "sort" / "title", encoding="utf-8") as fp:
+        text = fp.read()
+    ids = sorted(text[i:i + digits] for i in range(0, len(text), digits))
+
+    pages = index_pages(out)
+    # every book is listed once, on the page of the folder its ID names
+    expected = {}
+    for bid in ids:
+        path = osp.join(out, "content", *bid[:-1], "index.html")
+        expected.setdefault(path, []).append(bid)
+    assert pages == expected
+
+    # and next walks the pages in ID order
+    paths = sorted(pages)
+    for path, after in zip(paths, paths[1:]):
+        with open(path, encoding="utf-8") as fp:
+            link = re.search(r'class="next" href="([^"]+)"', fp.read()).group(1)
+        assert osp.normpath(osp.join(osp.dirname(path), link)) == after
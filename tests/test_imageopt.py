@@ -0,0 +1,88 @@
+"""Recompressing pictures and making thumbnails"""
+
+from io import BytesIO
+import os.path as osp
+import random
+import shutil
+import sys
+
+import pytest
+
+ROOT = osp.dirname(osp.dirname(osp.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+Image = pytest.importorskip("PIL.Image")
+
+from imageopt import ImageOptimizer, recompress, thumb_path
+
+# EXIF orientation 6: the stored pixels are to be turned 90 degrees clockwise
+ORIENTATION = 0x0112
+
+
+def photo(path, size=(64, 32), orientation=None):
+    """write a noisy picture saved at top quality so recompressing pays"""
+    rnd = random.Random(1)
+    image = Image.new("RGB", size)
+    image.putdata([tuple(rnd.randrange(256) for _ in range(3)) for _ in range(size[0] * size[1])])
+    exif = Image.Exif()
+    if orientation:
+        exif[ORIENTATION] = orientation
+    image.save(path, "JPEG", quality=100, exif=exif.tobytes())
+    with open(path, "rb") as fp:
+        return fp.read()
+
+
+def size_of(path):
+    with Image.open(path) as image:
+        return image.size
+
+
+def optimize(root, path, quality, sources=None, cache="", cover=True):
+    optimizer = ImageOptimizer(str(root), quality, 16, cache)
+    optimizer.run([path], [path] if cover else [], sources)
+    optimizer.save()
+    return optimizer
+
+
+def test_orientation_is_applied(tmp_path):
+    path = str(tmp_path / "0.jpg")
+    photo(path, orientation=6)
+    optimize(tmp_path, path, 80)
+    assert size_of(path) == (32, 64)
+    assert size_of(thumb_path(path)) == (8, 16)
+
+
+def test_new_settings_start_from_the_archive_copy(tmp_path):
+    archive = str(tmp_path / "archive.jpg")
+    original = photo(archive)
+    path = str(tmp_path / "0.jpg")
+    shutil.copyfile(archive, path)
+    optimize(tmp_path, path, 80, {path: [archive]})
+    optimizer = optimize(tmp_path, path, 60, {path: [archive]})
+    assert optimizer.optimized == 1
+    with open(path, "rb") as fp:
+        assert fp.read() == recompress(original, 60, 16)[0]
+
+
+def test_new_settings_start_from_the_cache(tmp_path):
+    path = str(tmp_path / "0.jpg")
+    original = photo(path)
+    cache = str(tmp_path / "cache")
+    optimize(tmp_path, path, 80, cache=cache)
+    optimize(tmp_path, path, 60, cache=cache)
+    with open(path, "rb") as fp:
+        assert fp.read() == recompress(original, 60, 16)[0]
+
+
+def test_optimized_picture_is_not_compressed_again(tmp_path):
+    path = str(tmp_path / "0.jpg")
+    photo(path)
+    optimize(tmp_path, path, 80, cover=False)
+    with open(path, "rb") as fp:
+        optimized = fp.read()
+    # no original anywhere, a new cover only gets its thumbnail
+    optimizer = optimize(tmp_path, path, 60)
+    assert optimizer.missing == 1
+    with open(path, "rb") as fp:
+        assert fp.read() == optimized
+    assert osp.exists(thumb_path(path))
@@ -0,0 +1,110 @@
+"""IsNumberHelper against the verdicts of the helper it replaced
+
+The verdicts below were recorded with the IsNumberHelper from before the
+leading number shortcut, so a change to the shortcut that drifts from it
+shows up here. Unit words depend on pint's default registry.
+"""
+
+import os.path as osp
+import sys
+
+import pytest
+
+ROOT = osp.dirname(osp.dirname(osp.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bookspellchecker import IsNumberHelper
+
+VERDICTS = [
+    # plain numbers
+    ('0', True),
+    ('7', True),
+    ('12', True),
+    ('2019', True),
+    ('01', True),
+    ('007', True),
+    ('3.14', True),
+    ('0.5', True),
+    ('.5', True),
+    ('1e5', True),
+    # ordinals, only the leading digit is looked at
+    ('1st', True),
+    ('2nd', True),
+    ('3rd', True),
+    ('4th', True),
+    ('21st', True),
+    ('0th', False),
+    ('11th', True),
+    ('th', True),
+    # comma numbers
+    ('1,000', True),
+    ('12,345,678', True),
+    ('1,a', True),
+    (',', True),
+    (',,', True),
+    ('1,', True),
+    (',5', True),
+    # powers of ten and arithmetic
+    ('10^3', True),
+    ('-10^3', True),
+    ('-10^-3', True),
+    ('10^+2', True),
+    ('2x10^5', True),
+    ('3*10^8', True),
+    ('2^3', True),
+    ('^3', False),
+    ('2+2=4', True),
+    ('2x3=6', True),
+    # hyphens
+    ('5-3', True),
+    ('1-2', True),
+    ('-5', True),
+    ('-', True),
+    ('1-cat', True),
+    ('a-b', True),
+    ('hello-world', False),
+    ('twenty-one', False),
+    # fractions
+    ('3/4', True),
+    ('1/2/3', True),
+    ('/', True),
+    ('cat/dog', False),
+    ('5/km', True),
+    # units
+    ('km', True),
+    ('5km', True),
+    ('10kg', True),
+    ('meter', True),
+    ('meters', True),
+    ('feet', True),
+    ('inches', True),
+    ('pound', True),
+    ('mph', True),
+    ('Hz', True),
+    ('m', True),
+    ('s', True),
+    ('kg/m', True),
+    ('10degC', True),
+    # plain words, pint reads some of them as units (centi-technical atmosphere)
+    ('cat', True),
+    ('dog', False),
+    ('the', False),
+    ('x', False),
+    ('X', False),
+    ('A', True),
+    ('I', False),
+    ('hello', False),
+    ('Sam', False),
+    ("can't", False),
+]
+
+
+@pytest.mark.parametrize("token, verdict", VERDICTS)
+def test_classify(token, verdict):
+    assert bool(IsNumberHelper.classify(token)) is verdict
+
+
+@pytest.mark.parametrize("token, verdict", VERDICTS)
+def test_remembered_verdict(token, verdict):
+    IsNumberHelper.isNumber(token)
+    assert bool(IsNumberHelper.isNumber(token)) is verdict
@@ -0,0 +1,27 @@
+"""Writing pages serially and with a pool"""
+
+import os.path as osp
+import sys
+
+import pytest
+
+ROOT = osp.dirname(osp.dirname(osp.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from renderpool import PageWriter
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_every_page_is_written(tmp_path, workers):
+    template = tmp_path / "page.mako"
+    template.write_text("<p>${text}</p>")
+    # a few batches and a partial one
+    writer = PageWriter(workers=workers, batch=5)
+    for i in range(23):
+        writer.add(str(template), dict(text=f"page {i}"), str(tmp_path / "out" / f"{i}.html"))
+    assert writer.run() == 23
+    for i in range(23):
+        assert (tmp_path / "out" / f"{i}.html").read_text() == f"<p>page {i}</p>"
+    # the writer can be used again after a run
+    writer.add(str(template), dict(text="again"), str(tmp_path / "out" / "again.html"))
+    assert writer.run() == 1
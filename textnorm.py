@@ -0,0 +1,76 @@
+"""Turn page text into the stemmed words we index
+
+The same few thousand words make up most of every book, so each distinct
+token is checked against the stop words and stemmed only once. The answers
+are kept in a bounded cache that can be saved to a file between runs.
+"""
+
+from hashlib import sha1
+from json import load as json_load, dump as json_dump
+from os import replace
+import os.path as osp
+from re import compile as regex_compile, IGNORECASE
+
+WORD = regex_compile(r"[a-z]+", flags=IGNORECASE)
+
+
+class WordNormalizer:
+    """Stop word filter and stemmer with a memo of every token seen"""
+
+    def __init__(self, stemmer, stop_words, size=100000, path=""):
+        self.stemmer = stemmer
+        self.stop_words = stop_words
+        self.size = size
+        self.path = path
+        # older stemmers look irregular forms up before lowercasing, so only
+        # fold the cache keys when case cannot change the stem
+        self.fold = stemmer.stem("Skies") == stemmer.stem("skies")
+        self.key = sha1(
+            "\n".join([type(stemmer).__name__, str(self.fold)] + sorted(stop_words)).encode("utf-8")
+        ).hexdigest()
+        self.cache = {}
+        self.hits = 0
+        self.misses = 0
+        if path and osp.exists(path):
+            with open(path, "rt", encoding="utf-8") as fp:
+                saved = json_load(fp)
+            if saved["key"] == self.key:
+                self.cache = saved["stems"]
+
+    def stem(self, token):
+        """Return the stem of a token or None for a stop word"""
+        key = token.lower() if self.fold else token
+        try:
+            stem = self.cache[key]
+            self.hits += 1
+        except KeyError:
+            self.misses += 1
+            if token.lower() in self.stop_words:
+                stem = None
+            else:
+                stem = self.stemmer.stem(token).lower()
+            if len(self.cache) < self.size:
+                self.cache[key] = stem
+        return stem
+
+    def words(self, texts):
+        """Return the set of stems in some page texts"""
+        # contractions takes a while to import, only the words stage needs it
+        from contractions import fix as contractions_fix
+
+        words = set()
+        for text in texts:
+            text = contractions_fix(text).replace("'", "")
+            for token in WORD.findall(text):
+                stem = self.stem(token)
+                if stem is not None:
+                    words.add(stem)
+        return words
+
+    def save(self):
+        """Keep the cache for the next run if a path was given"""
+        if not self.path:
+            return
+        with open(self.path + ".tmp", "wt", encoding="utf-8") as fp:
+            json_dump(dict(key=self.key, stems=self.cache), fp)
+        replace(self.path + ".tmp", self.path)
@@ -0,0 +1,78 @@
+"""Pack the word index into a few shard files
+
+The posting lists of all the terms are packed into a handful of shards
+and table.json says where each one is. The client
+loads the table once and then fetches a term with an HTTP range request, or
+keeps the whole shard when the server does not do ranges.
+
+A posting list is the sorted book numbers for a term, stored in whichever of
+two encodings is smaller:
+
+DELTA   the first number and then the gaps between numbers, as varints
+BITSET  the first number as a varint, then one bit for each number from
+        there to the last, least significant bit first
+"""
+
+from zlib import crc32
+
+DELTA = 0
+BITSET = 1
+
+
+def varint(value, out):
+    """Append value to out as an unsigned LEB128 varint"""
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def encode_delta(numbers):
+    out = bytearray()
+    previous = 0
+    for number in numbers:
+        varint(number - previous, out)
+        previous = number
+    return bytes(out)
+
+
+def encode_bitset(numbers):
+    out = bytearray()
+    first = numbers[0]
+    varint(first, out)
+    bits = bytearray((numbers[-1] - first) // 8 + 1)
+    for number in numbers:
+        offset = number - first
+        bits[offset >> 3] |= 1 << (offset & 7)
+    return bytes(out + bits)
+
+
+def encode_postings(numbers):
+    """Return (kind, bytes) for sorted unique book numbers"""
+    if not numbers:
+        return DELTA, b""
+    delta = encode_delta(numbers)
+    bitset = encode_bitset(numbers)
+    if len(bitset) < len(delta):
+        return BITSET, bitset
+    return DELTA, delta
+
+
+def shard_of(term, shards):
+    return crc32(term.encode("utf-8")) % shards
+
+
+def pack(postings, shards=16):
+    """Pack a term to book numbers map into shards
+
+    Returns the list of shard contents and the table for table.json.
+    """
+    contents = [bytearray() for _ in range(shards)]
+    terms = {}
+    for term in sorted(postings):
+        numbers = sorted(set(postings[term]))
+        kind, data = encode_postings(numbers)
+        shard = shard_of(term, shards)
+        terms[term] = [shard, len(contents[shard]), len(data), kind]
+        contents[shard] += data
+    return [bytes(content) for content in contents], dict(shards=shards, terms=terms)